@@ -1,17 +1,48 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, ValidationError
 from typing import List, Dict, Optional
-from db import DatabaseHandler
-from datetime import datetime
+from db import DatabaseHandler, STATUS_ENCOMENDAS_ABERTAS
+from db_async import AsyncDatabaseHandler
+from feed import StockFeed
+from metrics import MetricsMiddleware
+from order_parser import parse_stream
+from scheduler import OpenOrderPlanner, DEFAULT_LINES, MINUTES_PER_DAY
+from mrp import plan_from_encomendas, DEFAULT_HORIZON, DEFAULT_LEAD_TIME
+import metrics
+from datetime import date, datetime, timedelta
+from collections import Counter
+from tempfile import SpooledTemporaryFile
+from contextlib import asynccontextmanager
+import asyncio
+import codecs
+import json
+import os
 
-app = FastAPI(title="SciTech API")
-db = DatabaseHandler()
+db = AsyncDatabaseHandler(event_listeners=[metrics.listener])
+feed_estoque = StockFeed(tamanho_fila=int(os.getenv('STOCK_FEED_QUEUE_SIZE', '100')))
+
+@asynccontextmanager
+async def lifespan(app):
+    # A ligação ao MongoDB só é aberta quando o servidor arranca, não no import
+    await db.conecta()
+    feed_estoque.liga(asyncio.get_running_loop())
+    await db.adiciona_ouvinte_estoque(feed_estoque.publica)
+    yield
+    await db.remove_ouvinte_estoque(feed_estoque.publica)
+    await _descarta_planeador()
+    await db.close_connection()
+
+app = FastAPI(title="SciTech API", lifespan=lifespan)
+app.add_middleware(MetricsMiddleware, registo=metrics.registo)
 
 class Material(BaseModel):
     id_material: str
     nome: str
     quantidade_disponivel: float
     preco_por_unidade: float
+    ponto_encomenda: Optional[float] = None
 
 class MaterialQuantidade(BaseModel):
     id_material: str
@@ -27,6 +58,25 @@ class Encomenda(BaseModel):
     prazo_entrega: str
     observacoes: Optional[str] = None
 
+class ItemProducao(BaseModel):
+    id_tipo: str
+    tamanho: str
+    quantidade: int = 1
+
+class ProducaoLote(BaseModel):
+    itens: Optional[List[ItemProducao]] = None
+    id_encomenda: Optional[str] = None
+
+class EntregaPrevista(BaseModel):
+    id_entrega: str
+    id_material: str
+    quantidade: float
+    data_prevista: str
+
+class NotaEncomenda(BaseModel):
+    materiais: Dict[str, float]
+    total: Optional[float] = None
+
 @app.get("/")
 async def root():
     return {"message": "SciTech API v1.0"}
@@ -34,29 +84,89 @@ async def root():
 # Endpoints para Materiais
 @app.get("/materiais/", response_model=List[Material])
 async def get_materiais():
-    return db.get_todos_materiais()
+    return await db.get_todos_materiais()
 
 @app.get("/materiais/{id_material}")
 async def get_material(id_material: str):
-    material = db.get_material(id_material)
+    material = await db.get_material(id_material)
     if not material:
         raise HTTPException(status_code=404, detail="Material não encontrado")
     return material
 
+def _resposta_condicional(request, conteudo, etag):
+    """Resposta com ETag; 304 sem corpo se o cliente já tiver esta versão (If-None-Match)"""
+    cabecalhos = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        etags_cliente = {valor.strip().removeprefix("W/") for valor in if_none_match.split(",")}
+        if "*" in etags_cliente or etag in etags_cliente:
+            return Response(status_code=304, headers=cabecalhos)
+    return JSONResponse(content=conteudo, headers=cabecalhos)
+
 @app.get("/materiais/quantidade/{id_material}")
-async def get_quantidade_material(id_material: str):
-    quantidade = db.get_quantidade_material(id_material)
+async def get_quantidade_material(id_material: str, request: Request):
+    quantidade, etag = await db.get_quantidade_estoque(id_material)
     if quantidade is None:
         raise HTTPException(status_code=404, detail="Material não encontrado")
-    return {"id_material": id_material, "quantidade": quantidade}
+    return _resposta_condicional(request, {"id_material": id_material, "quantidade": quantidade}, etag)
 
 @app.get("/materiais/quantidades/")
-async def get_todas_quantidades():
-    return db.get_quantidade_todos_materiais()
+async def get_todas_quantidades(request: Request):
+    quantidades, etag = await db.get_quantidades_estoque()
+    return _resposta_condicional(request, quantidades, etag)
+
+def _evento_sse(tipo, dados, id_evento=None):
+    linhas = f"id: {id_evento}\n" if id_evento is not None else ""
+    return f"{linhas}event: {tipo}\ndata: {json.dumps(dados, default=str)}\n\n"
+
+@app.get("/materiais/stream/")
+async def stream_estoque(request: Request):
+    """
+    Feed de estoque em Server-Sent Events: começa com o estado completo
+    ("snapshot") e segue com um evento por alteração ("estoque") e por
+    cruzamento do ponto de encomenda ("ponto_encomenda").
+    """
+    fila = feed_estoque.subscreve()
+
+    async def eventos():
+        try:
+            quantidades, etag = await db.get_quantidades_estoque()
+            yield _evento_sse("snapshot", {"quantidades": quantidades, "etag": etag})
+            while True:
+                try:
+                    evento = await asyncio.wait_for(fila.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    # Comentário SSE: mantém a ligação aberta através de proxies
+                    yield ": ping\n\n"
+                    continue
+                if evento["tipo"] == "sincroniza":
+                    # Cliente ficou para trás: eventos descartados, reenvia o estado completo
+                    quantidades, etag = await db.get_quantidades_estoque()
+                    yield _evento_sse("snapshot", {"quantidades": quantidades, "etag": etag}, evento["id"])
+                else:
+                    yield _evento_sse(evento["tipo"], evento, evento["id"])
+        finally:
+            feed_estoque.cancela(fila)
+
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/materiais/stream/estatisticas/")
+async def get_estatisticas_stream_estoque():
+    return feed_estoque.estatisticas()
+
+@app.get("/materiais/quantidades/snapshot/")
+async def get_estatisticas_snapshot_estoque():
+    return await db.get_estatisticas_snapshot_estoque()
 
 @app.post("/materiais/ajuste/")
 async def ajustar_quantidade_material(material: MaterialQuantidade):
-    sucesso = db.ajusta_estoque_material(
+    sucesso = await db.ajusta_estoque_material(
         material.id_material, 
         material.quantidade
     )
@@ -68,32 +178,88 @@ async def ajustar_quantidade_material(material: MaterialQuantidade):
     return {"message": "Estoque ajustado com sucesso"}
 
 # Endpoints para Encomendas
+
+# Tamanho das páginas das listagens: por omissão e máximo pedido com ?limite=
+LIMITE_PAGINA_PADRAO = 100
+LIMITE_PAGINA_MAXIMO = int(os.getenv('LIMITE_PAGINA_MAXIMO', '1000'))
+
+def _serializa_encomenda(encomenda):
+    if "_id" in encomenda:
+        encomenda["_id"] = str(encomenda["_id"])
+    return encomenda
+
+async def _lista_encomendas(filtro, limite, cursor, campos, formato):
+    """
+    Listagem paginada (limite/cursor) ou em streaming NDJSON (formato=ndjson).
+    Devolve None quando nenhum dos modos foi pedido.
+    """
+    lista_campos = [campo.strip() for campo in campos.split(",") if campo.strip()] if campos else None
+
+    if formato == "ndjson":
+        encomendas = await db.itera_encomendas(filtro, lista_campos)
+        linhas = (json.dumps(_serializa_encomenda(e), default=str) + "\n" for e in encomendas)
+        return StreamingResponse(linhas, media_type="application/x-ndjson")
+
+    if limite is not None or cursor is not None or lista_campos:
+        limite = LIMITE_PAGINA_PADRAO if limite is None else limite
+        try:
+            pagina = await db.get_encomendas_paginadas(filtro, limite, cursor, lista_campos)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        pagina["encomendas"] = [_serializa_encomenda(e) for e in pagina["encomendas"]]
+        return pagina
+
+    return None
+
 @app.get("/encomendas/")
-async def get_encomendas():
-    return db.get_todas_encomendas()
+async def get_encomendas(limite: Optional[int] = Query(None, ge=1, le=LIMITE_PAGINA_MAXIMO),
+                         cursor: Optional[str] = None, campos: Optional[str] = None, formato: str = "json"):
+    resposta = await _lista_encomendas(None, limite, cursor, campos, formato)
+    if resposta is not None:
+        return resposta
+    return await db.get_todas_encomendas()
 
 @app.get("/encomendas/{id_encomenda}")
 async def get_encomenda(id_encomenda: str):
-    encomenda = db.get_encomenda(id_encomenda)
+    encomenda = await db.get_encomenda(id_encomenda)
     if not encomenda:
         raise HTTPException(status_code=404, detail="Encomenda não encontrada")
     return encomenda
 
 @app.get("/encomendas/status/{status}")
-async def get_encomendas_por_status(status: str):
-    return db.get_encomendas_por_status(status)
+async def get_encomendas_por_status(status: str,
+                                    limite: Optional[int] = Query(None, ge=1, le=LIMITE_PAGINA_MAXIMO),
+                                    cursor: Optional[str] = None, campos: Optional[str] = None, formato: str = "json"):
+    resposta = await _lista_encomendas({"status": status}, limite, cursor, campos, formato)
+    if resposta is not None:
+        return resposta
+    return await db.get_encomendas_por_status(status)
 
 @app.get("/encomendas/cliente/nome/{nome}")
-async def get_encomendas_por_cliente_nome(nome: str):
-    return db.get_encomendas_por_cliente_nome(nome)
+async def get_encomendas_por_cliente_nome(nome: str,
+                                          limite: Optional[int] = Query(None, ge=1, le=LIMITE_PAGINA_MAXIMO),
+                                          cursor: Optional[str] = None, campos: Optional[str] = None,
+                                          formato: str = "json"):
+    filtro = await db.filtro_cliente_nome(nome)
+    resposta = await _lista_encomendas(filtro, limite, cursor, campos, formato)
+    if resposta is not None:
+        return resposta
+    return await db.get_encomendas_por_cliente_nome(nome)
 
 @app.get("/encomendas/cliente/email/{email}")
-async def get_encomendas_por_cliente_email(email: str):
-    return db.get_encomendas_por_cliente_email(email)
+async def get_encomendas_por_cliente_email(email: str,
+                                           limite: Optional[int] = Query(None, ge=1, le=LIMITE_PAGINA_MAXIMO),
+                                           cursor: Optional[str] = None, campos: Optional[str] = None,
+                                           formato: str = "json"):
+    filtro = DatabaseHandler.filtro_cliente_email(email)
+    resposta = await _lista_encomendas(filtro, limite, cursor, campos, formato)
+    if resposta is not None:
+        return resposta
+    return await db.get_encomendas_por_cliente_email(email)
 
 @app.post("/encomendas/")
 async def criar_encomenda(encomenda: Encomenda):
-    resultado = db.insere_encomenda(encomenda.dict())
+    resultado = await db.insere_encomenda(encomenda.dict())
     if not resultado:
         raise HTTPException(
             status_code=400, 
@@ -101,9 +267,257 @@ async def criar_encomenda(encomenda: Encomenda):
         )
     return {"message": "Encomenda criada com sucesso"}
 
+# Importação em massa de encomendas
+
+# Nomes de peças usados nos ficheiros de encomenda -> id_tipo. Outros nomes
+# usam "<NOME>001", desde que esse tipo de roupa exista na base de dados
+ID_TIPO_POR_NOME = {
+    "Tshirt": "TSHIRT001",
+    "Calcoes": "CALCOES001"
+}
+PRAZO_ENTREGA_PADRAO_DIAS = int(os.getenv('PRAZO_ENTREGA_PADRAO_DIAS', '30'))
+# Máximo de linhas não reconhecidas devolvidas na resposta (o total é sempre indicado)
+LIMITE_LINHAS_IGNORADAS = 100
+
+def _encomendas_do_ficheiro(ficheiro, origem, prefixo, base, tipos, linhas, ignoradas):
+    """
+    Converte cada encomenda do ficheiro (lida em streaming pelo order_parser)
+    numa encomenda com um único item, com id "<prefixo>-<n>": importar o
+    mesmo ficheiro outra vez atualiza as mesmas encomendas.
+
+    Encomendas de peças sem tipo de roupa em `tipos` (ids existentes) não são
+    importadas: contam como linhas ignoradas, com o motivo.
+    """
+    def ignora(line_no, texto, motivo):
+        ignoradas["total"] += 1
+        if len(ignoradas["linhas"]) < LIMITE_LINHAS_IGNORADAS:
+            ignoradas["linhas"].append({"linha": line_no, "texto": texto[:200], "motivo": motivo})
+
+    def linha_ignorada(linha):
+        ignora(linha.line_no, linha.text, "Formato não reconhecido")
+
+    registos = parse_stream(ficheiro, source=origem, on_error=linha_ignorada)
+    # n conta todas as encomendas do ficheiro, importadas ou não, para os ids não mudarem entre importações
+    for n, registo in enumerate(registos, start=1):
+        id_tipo = ID_TIPO_POR_NOME.get(registo.type, f"{registo.type.upper()}001")
+        if id_tipo not in tipos:
+            ignora(registo.line_no, f"{registo.quantity} {registo.type} {registo.size}",
+                   f"Tipo de roupa não encontrado: {registo.type}")
+            continue
+        linhas.append(registo.line_no)
+        yield {
+            **base,
+            "id_encomenda": f"{prefixo}-{n}",
+            "itens": [{
+                "id_tipo": id_tipo,
+                "tamanho": registo.size,
+                "quantidade": registo.quantity
+            }],
+            "observacoes": f"Importada de {origem}, linha {registo.line_no}"
+        }
+
+def _encomendas_json(documentos, resultados, posicoes):
+    """
+    Valida as encomendas JSON à medida que são lidas e entrega as válidas
+    (consumido por insere_encomendas, bloco a bloco). Cada registo ocupa uma
+    posição em `resultados`: os inválidos ficam logo com o erro, os válidos
+    ficam a None e a posição vai para `posicoes`.
+    """
+    for documento, extra in documentos:
+        if isinstance(documento, ValueError):
+            resultados.append({"id_encomenda": None, "status": "erro", "erro": f"JSON inválido: {documento}", **extra})
+            continue
+        try:
+            encomenda = Encomenda(**documento).dict()
+        except (ValidationError, TypeError) as e:
+            resultados.append({
+                "id_encomenda": documento.get("id_encomenda") if isinstance(documento, dict) else None,
+                "status": "erro",
+                "erro": str(e),
+                **extra
+            })
+            continue
+        posicoes.append(len(resultados))
+        resultados.append(extra or None)
+        yield encomenda
+
+def _documentos_ndjson(corpo):
+    """(documento, {"linha": n}) de cada linha não vazia; linhas com JSON inválido dão o ValueError"""
+    for numero, linha in enumerate(corpo, start=1):
+        if not linha.strip():
+            continue
+        try:
+            yield json.loads(linha), {"linha": numero}
+        except ValueError as e:
+            yield e, {"linha": numero}
+
+def _documentos_lista_json(corpo, tamanho_leitura=64 * 1024):
+    """
+    Lê uma lista JSON elemento a elemento (JSONDecoder.raw_decode sobre um
+    buffer lido aos blocos), sem carregar a lista inteira. Devolve pares
+    (documento, {}); um erro de sintaxe dá o ValueError e termina a leitura.
+    O corpo tem de começar por "[" (ver _comeca_por).
+    """
+    descodificador = json.JSONDecoder()
+    leitor = codecs.getincrementaldecoder("utf-8")()
+    buffer, pos, fim = "", 0, False
+
+    def le_mais():
+        nonlocal buffer, pos, fim
+        bloco = corpo.read(tamanho_leitura)
+        fim = not bloco
+        buffer = buffer[pos:] + leitor.decode(bloco, final=fim)
+        pos = 0
+
+    def proximo_caracter():
+        # Primeiro caracter que não é espaço, sem o consumir ("" no fim do corpo)
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n":
+                pos += 1
+            if pos < len(buffer) or fim:
+                return buffer[pos:pos + 1]
+            le_mais()
+
+    try:
+        proximo_caracter()
+        pos += 1
+        separador, primeiro = False, True
+        while True:
+            caracter = proximo_caracter()
+            if caracter == "]" and (separador or primeiro):
+                return
+            if not caracter:
+                raise ValueError("lista JSON incompleta")
+            if separador:
+                if caracter != ",":
+                    raise ValueError(f"esperado ',' ou ']' em vez de {caracter!r}")
+                pos += 1
+                separador = False
+                continue
+            try:
+                documento, fim_documento = descodificador.raw_decode(buffer, pos)
+                # Um valor que acaba no fim do buffer pode continuar no bloco seguinte (ex: números)
+                completo = fim or fim_documento < len(buffer)
+            except ValueError:
+                if fim:
+                    raise
+                completo = False
+            if not completo:
+                le_mais()
+                continue
+            pos = fim_documento
+            separador, primeiro = True, False
+            yield documento, {}
+    except ValueError as e:
+        yield e, {}
+
+def _comeca_por(corpo, caracter):
+    """Indica se o primeiro caracter do corpo que não é espaço é `caracter` (e volta ao início)"""
+    corpo.seek(0)
+    while True:
+        bloco = corpo.read(4096)
+        inicio = bloco.lstrip()
+        if inicio or not bloco:
+            break
+    corpo.seek(0)
+    return inicio[:1] == caracter
+
+def _resumo_importacao(resultados, **extra):
+    contagens = Counter(resultado["status"] for resultado in resultados)
+    return {
+        "total": len(resultados),
+        "inseridas": contagens["inserida"],
+        "atualizadas": contagens["atualizada"],
+        "erros": contagens["erro"],
+        **extra,
+        "resultados": resultados
+    }
+
+@app.post("/encomendas/importar/")
+async def importar_encomendas(request: Request, prefixo: Optional[str] = None, cliente_nome: Optional[str] = None,
+                              cliente_email: Optional[str] = None, prazo_entrega: Optional[str] = None,
+                              status: str = "pendente"):
+    """
+    Importa encomendas em massa, escritas em blocos com bulk_write não ordenado.
+
+    - multipart/form-data com o campo "ficheiro": ficheiro de encomendas
+      (encomenda1-3.txt, qualquer formato do order_parser), lido em streaming;
+      cada encomenda do ficheiro dá uma encomenda com um item (peças sem tipo
+      de roupa na base de dados são ignoradas). Cliente, prazo e status vêm
+      dos parâmetros da query.
+    - application/json (lista de encomendas) ou application/x-ndjson (uma por
+      linha), no formato de POST /encomendas/. As encomendas são lidas,
+      validadas e escritas bloco a bloco; uma linha NDJSON com JSON inválido
+      dá um erro só nessa linha, e um erro de sintaxe na lista JSON termina a
+      importação nesse ponto (as encomendas anteriores ficam escritas).
+
+    Devolve o resultado de cada registo, pela ordem de entrada.
+    """
+    tipo_conteudo = request.headers.get("content-type", "")
+
+    if tipo_conteudo.startswith("multipart/form-data"):
+        formulario = await request.form()
+        ficheiro = formulario.get("ficheiro")
+        if ficheiro is None or not hasattr(ficheiro, "file"):
+            raise HTTPException(status_code=400, detail="Envie o ficheiro de encomendas no campo 'ficheiro'")
+
+        origem = ficheiro.filename or "ficheiro"
+        agora = datetime.now()
+        base = {
+            "data_criacao": agora.isoformat(),
+            "cliente": {"nome": cliente_nome, "email": cliente_email},
+            "status": status,
+            "valor_total": 0.0,
+            "prazo_entrega": prazo_entrega or (agora + timedelta(days=PRAZO_ENTREGA_PADRAO_DIAS)).date().isoformat()
+        }
+        tipos = {tipo["id_tipo"] for tipo in await db.get_todos_tipos_roupa()}
+        linhas = []
+        ignoradas = {"total": 0, "linhas": []}
+        encomendas = _encomendas_do_ficheiro(
+            ficheiro.file, origem, prefixo or os.path.splitext(os.path.basename(origem))[0], base, tipos,
+            linhas, ignoradas
+        )
+        try:
+            # O gerador é consumido na thread do MongoDB, bloco a bloco
+            resultados = await db.insere_encomendas(encomendas)
+        finally:
+            await ficheiro.close()
+        for resultado, linha in zip(resultados, linhas):
+            resultado["linha"] = linha
+        return _resumo_importacao(
+            resultados, linhas_ignoradas=ignoradas["total"], exemplos_ignorados=ignoradas["linhas"]
+        )
+
+    ndjson = "ndjson" in tipo_conteudo
+    if not (ndjson or "json" in tipo_conteudo):
+        raise HTTPException(
+            status_code=415,
+            detail="Use multipart/form-data (ficheiro), application/json ou application/x-ndjson"
+        )
+
+    # O corpo vai para um ficheiro temporário à medida que chega (em memória até 1 MB)
+    with SpooledTemporaryFile(max_size=1024 * 1024, mode="w+b") as corpo:
+        async for bloco in request.stream():
+            corpo.write(bloco)
+        if ndjson:
+            corpo.seek(0)
+            documentos = _documentos_ndjson(corpo)
+        elif await run_in_threadpool(_comeca_por, corpo, b"["):
+            documentos = _documentos_lista_json(corpo)
+        else:
+            raise HTTPException(status_code=400, detail="Envie uma lista de encomendas")
+
+        resultados, posicoes = [], []
+        # O gerador é consumido na thread do MongoDB: leitura, validação e escrita bloco a bloco
+        escritas = await db.insere_encomendas(_encomendas_json(documentos, resultados, posicoes))
+    for posicao, resultado in zip(posicoes, escritas):
+        resultados[posicao] = {**resultado, **(resultados[posicao] or {})}
+    return _resumo_importacao(resultados)
+
 @app.put("/encomendas/{id_encomenda}/status/{novo_status}")
 async def atualizar_status_encomenda(id_encomenda: str, novo_status: str):
-    resultado = db.atualiza_status_encomenda(id_encomenda, novo_status)
+    resultado = await db.atualiza_status_encomenda(id_encomenda, novo_status)
     if not resultado:
         raise HTTPException(
             status_code=400, 
@@ -114,7 +528,7 @@ async def atualizar_status_encomenda(id_encomenda: str, novo_status: str):
 # Endpoints para Produção
 @app.get("/producao/materiais-necessarios/{id_tipo}/{tamanho}/{quantidade}")
 async def calcular_materiais_necessarios(id_tipo: str, tamanho: str, quantidade: int = 1):
-    materiais = db.calcula_materiais_necessarios(id_tipo, tamanho, quantidade)
+    materiais = await db.calcula_materiais_necessarios(id_tipo, tamanho, quantidade)
     if not materiais:
         raise HTTPException(
             status_code=404, 
@@ -122,9 +536,13 @@ async def calcular_materiais_necessarios(id_tipo: str, tamanho: str, quantidade:
         )
     return materiais
 
+@app.get("/producao/cache-receitas/")
+async def get_estatisticas_cache_receitas():
+    return await db.get_estatisticas_cache()
+
 @app.get("/producao/verificar-disponibilidade/{id_tipo}/{tamanho}/{quantidade}")
 async def verificar_disponibilidade(id_tipo: str, tamanho: str, quantidade: int = 1):
-    disponibilidade = db.verifica_disponibilidade_producao(id_tipo, tamanho, quantidade)
+    disponibilidade = await db.verifica_disponibilidade_producao(id_tipo, tamanho, quantidade)
     if disponibilidade is None:
         raise HTTPException(
             status_code=404, 
@@ -134,10 +552,220 @@ async def verificar_disponibilidade(id_tipo: str, tamanho: str, quantidade: int
 
 @app.post("/producao/processar/{id_tipo}/{tamanho}/{quantidade}")
 async def processar_producao(id_tipo: str, tamanho: str, quantidade: int = 1):
-    sucesso = db.processa_producao(id_tipo, tamanho, quantidade)
+    if quantidade < 0:
+        raise HTTPException(status_code=400, detail="A quantidade não pode ser negativa")
+    sucesso = await db.processa_producao(id_tipo, tamanho, quantidade)
     if not sucesso:
         raise HTTPException(
             status_code=400, 
             detail="Não foi possível processar a produção"
         )
     return {"message": "Produção processada com sucesso"}
+
+@app.post("/producao/processar-lote/")
+async def processar_producao_lote(lote: ProducaoLote):
+    if lote.id_encomenda:
+        encomenda = await db.get_encomenda(lote.id_encomenda)
+        if not encomenda:
+            raise HTTPException(status_code=404, detail="Encomenda não encontrada")
+        itens = encomenda["itens"]
+    elif lote.itens:
+        itens = [item.dict() for item in lote.itens]
+    else:
+        raise HTTPException(
+            status_code=400, 
+            detail="Indique os itens ou o id_encomenda"
+        )
+
+    resultado = await db.processa_producao_lote(itens)
+    if not resultado["sucesso"]:
+        raise HTTPException(status_code=400, detail=resultado)
+    return resultado
+
+# Plano de produção (EDF por prazo de entrega, ver scheduler.py)
+LINHAS_PRODUCAO = int(os.getenv('LINHAS_PRODUCAO', str(DEFAULT_LINES)))
+MINUTOS_POR_DIA = int(os.getenv('MINUTOS_POR_DIA', str(MINUTES_PER_DAY)))
+
+# Planeador mantido entre pedidos e atualizado pelos eventos do DatabaseHandler
+planeador = None
+_lock_planeador = asyncio.Lock()
+
+async def _descarta_planeador():
+    global planeador
+    if planeador is not None:
+        await db.remove_ouvinte_estoque(planeador.on_stock_event)
+        await db.remove_ouvinte_encomendas(planeador.on_event)
+        planeador = None
+
+async def _obtem_planeador(linhas, minutos_por_dia):
+    """
+    Devolve o planeador, construindo-o apenas no primeiro pedido, quando
+    muda o dia ou a configuração, ou quando um evento não pôde ser aplicado.
+    """
+    global planeador
+    async with _lock_planeador:
+        hoje = date.today()
+        if (planeador is not None and not planeador.stale and planeador.start_date == hoje
+                and planeador.lines == linhas and planeador.minutes_per_day == minutos_por_dia):
+            return planeador
+
+        await _descarta_planeador()
+        encomendas, tipos_roupa, estoque, entregas = await asyncio.gather(
+            db.get_encomendas_abertas(),
+            db.get_todos_tipos_roupa(),
+            db.get_quantidade_todos_materiais(),
+            db.get_entregas_previstas()
+        )
+        novo = await run_in_threadpool(
+            OpenOrderPlanner, tipos_roupa, estoque, entregas, encomendas, hoje, linhas, minutos_por_dia,
+            STATUS_ENCOMENDAS_ABERTAS
+        )
+        await db.adiciona_ouvinte_estoque(novo.on_stock_event)
+        await db.adiciona_ouvinte_encomendas(novo.on_event)
+        planeador = novo
+        return planeador
+
+@app.get("/producao/plano/")
+async def get_plano_producao(linhas: Optional[int] = None, minutos_por_dia: Optional[int] = None,
+                             limite: Optional[int] = Query(None, ge=1)):
+    linhas = LINHAS_PRODUCAO if linhas is None else linhas
+    minutos_por_dia = MINUTOS_POR_DIA if minutos_por_dia is None else minutos_por_dia
+    if linhas <= 0 or minutos_por_dia <= 0:
+        raise HTTPException(status_code=400, detail="linhas e minutos_por_dia têm de ser positivos")
+    atual = await _obtem_planeador(linhas, minutos_por_dia)
+    # Só o troço do plano afetado pelas alterações desde o último pedido é recalculado
+    resultado = await run_in_threadpool(atual.plan)
+    if limite is not None:
+        resultado["plano"] = resultado["plano"][:limite]
+    return resultado
+
+# Planeamento de necessidades de materiais (MRP, ver mrp.py)
+ESTOQUE_SEGURANCA = float(os.getenv('ESTOQUE_SEGURANCA', '1000'))
+PRAZO_FORNECEDOR_DIAS = int(os.getenv('PRAZO_FORNECEDOR_DIAS', str(DEFAULT_LEAD_TIME)))
+
+@app.get("/producao/mrp/")
+async def get_plano_materiais(horizonte: int = DEFAULT_HORIZON, antecedencia: int = 0,
+                              estoque_seguranca: Optional[float] = None, prazo_fornecedor: Optional[int] = None,
+                              lote: Optional[float] = None, minimo: Optional[float] = None, detalhe: bool = False):
+    """
+    Necessidades de materiais das encomendas abertas, por dia (prazo_entrega
+    menos `antecedencia` dias), líquidas do estoque e das entregas previstas,
+    e as encomendas a fornecedores a lançar (recuadas pelo prazo do fornecedor).
+    """
+    if horizonte <= 0 or horizonte > 5 * DEFAULT_HORIZON:
+        raise HTTPException(status_code=400, detail=f"O horizonte tem de estar entre 1 e {5 * DEFAULT_HORIZON} dias")
+    if (prazo_fornecedor is not None and prazo_fornecedor < 0) or antecedencia < 0:
+        raise HTTPException(status_code=400, detail="prazo_fornecedor e antecedencia não podem ser negativos")
+    encomendas, tipos_roupa, estoque, entregas = await asyncio.gather(
+        db.get_encomendas_abertas(campos=["id_encomenda", "itens", "prazo_entrega"]),
+        db.get_todos_tipos_roupa(),
+        db.get_quantidade_todos_materiais(),
+        db.get_entregas_previstas()
+    )
+    resultado, ignoradas, fora_horizonte = await run_in_threadpool(
+        plan_from_encomendas, encomendas, tipos_roupa, estoque, entregas,
+        horizon=horizonte,
+        production_offset=antecedencia,
+        lead_time=PRAZO_FORNECEDOR_DIAS if prazo_fornecedor is None else prazo_fornecedor,
+        safety_stock=ESTOQUE_SEGURANCA if estoque_seguranca is None else estoque_seguranca,
+        lot_size=lote,
+        min_order=minimo
+    )
+    return {
+        **resultado.as_dict(detail=detalhe),
+        "encomendas": len(encomendas),
+        "ignoradas": ignoradas,
+        "fora_horizonte": fora_horizonte
+    }
+
+# Endpoints para Entregas previstas
+@app.get("/entregas/")
+async def get_entregas_previstas():
+    return await db.get_entregas_previstas()
+
+@app.post("/entregas/")
+async def criar_entrega_prevista(entrega: EntregaPrevista):
+    if not await db.get_material(entrega.id_material):
+        raise HTTPException(status_code=404, detail="Material não encontrado")
+    await db.insere_entrega_prevista(entrega.dict())
+    return {"message": "Entrega prevista registada com sucesso"}
+
+@app.post("/entregas/{id_entrega}/receber")
+async def receber_entrega(id_entrega: str):
+    entrega = await db.regista_entrega_recebida(id_entrega)
+    if entrega is None:
+        raise HTTPException(status_code=404, detail="Entrega prevista não encontrada ou já recebida")
+    return entrega
+
+# Endpoints de análise (agregações no servidor)
+def _filtro_analise(status, desde, ate, campo_data):
+    try:
+        return DatabaseHandler.filtro_encomendas(status, desde, ate, campo_data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/analise/procura-materiais/")
+async def get_procura_materiais(status: Optional[str] = None, desde: Optional[str] = None,
+                                ate: Optional[str] = None, campo_data: str = "data_criacao"):
+    filtro = _filtro_analise(status, desde, ate, campo_data)
+    return await db.procura_materiais(filtro)
+
+@app.get("/analise/encomendas/")
+async def get_resumo_encomendas(status: Optional[str] = None, desde: Optional[str] = None,
+                                ate: Optional[str] = None, campo_data: str = "data_criacao"):
+    filtro = _filtro_analise(status, desde, ate, campo_data)
+    return await db.resumo_encomendas(filtro)
+
+# Endpoints de fornecedores
+@app.post("/fornecedores/nota-encomenda/")
+async def gerar_nota_encomenda(nota: NotaEncomenda):
+    # Import tardio: fpdf/PyPDF2 só são carregados quando se gera a primeira nota
+    from supply_processing import render_supplier_order_pdf
+    if not nota.materiais:
+        raise HTTPException(status_code=400, detail="Indique pelo menos um material")
+    try:
+        pdf = await run_in_threadpool(render_supplier_order_pdf, nota.materiais, nota.total)
+    except FileNotFoundError:
+        raise HTTPException(status_code=500, detail="Template da nota de encomenda não encontrado")
+    return Response(
+        content=pdf,
+        media_type="application/pdf",
+        headers={"Content-Disposition": 'inline; filename="Nota_de_Encomenda.pdf"'}
+    )
+
+# Endpoints de diagnóstico
+@app.get("/diagnostico/planos/")
+async def get_planos_consultas():
+    return await db.explica_consultas()
+
+@app.get("/diagnostico/mongodb/")
+async def get_resumo_comandos_mongodb():
+    return metrics.registo.resumo_comandos()
+
+@app.get("/diagnostico/profiler/")
+async def get_profiler(limite: Optional[int] = Query(None, ge=1), limpar: bool = False):
+    # Pilhas no formato collapsed (flamegraph.pl, speedscope); limpar=true recomeça as contagens depois de as ler
+    return Response(content=metrics.profiler.collapsed(limite, limpar), media_type="text/plain")
+
+@app.get("/diagnostico/profiler/estado/")
+async def get_estado_profiler():
+    return metrics.profiler.estado()
+
+@app.post("/diagnostico/profiler/iniciar/")
+async def iniciar_profiler(intervalo: Optional[float] = None, limpar: bool = False):
+    if intervalo is not None and intervalo <= 0:
+        raise HTTPException(status_code=400, detail="O intervalo tem de ser positivo")
+    if limpar:
+        metrics.profiler.limpa()
+    metrics.profiler.inicia(intervalo)
+    return metrics.profiler.estado()
+
+@app.post("/diagnostico/profiler/parar/")
+async def parar_profiler():
+    await run_in_threadpool(metrics.profiler.para)
+    return metrics.profiler.estado()
+
+# Métricas no formato de texto do Prometheus
+@app.get("/metrics")
+async def get_metricas():
+    return Response(content=metrics.registo.prometheus(), media_type="text/plain; version=0.0.4")
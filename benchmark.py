@@ -0,0 +1,434 @@
+"""
+Benchmarks for the order parsing, BOM, stock simulation and database hot paths.
+
+Generates synthetic encomenda files in the three supported formats, times
+parsing, BOM computation and the stock simulation for each size, and runs
+the DatabaseHandler methods (and, when FastAPI's TestClient is available,
+the API endpoints) against mongomock, an in-process MongoDB stand-in,
+counting the collection calls each one makes.
+
+    pip install mongomock            # only needed for the DB/API benchmarks
+    python benchmark.py --sizes 1000,100000 --output bench.json
+    python benchmark.py --output new.json --baseline bench.json --threshold 1.25
+
+With --baseline the run exits with status 1 if any benchmark's median time
+got slower than the baseline by more than the threshold.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+from bom import BOMTensor
+from data_processing import MATERIALS_BASE, SIZE_RATIO
+from ingest import process_order_file, simulate_stock
+from order_parser import COMPACT_FORMAT, LINE_FORMAT, TEXT_FORMAT, parse_file
+from simulation import StockSimulator, policy_from_constants
+
+DEFAULT_SIZES = "1000,10000,100000"
+# Encomendas por linha (= por dia) em cada formato, como nos ficheiros de exemplo
+ORDERS_PER_LINE = {LINE_FORMAT: 1, COMPACT_FORMAT: 100, TEXT_FORMAT: 20}
+GENERATE_CHUNK = 100_000
+
+# Métodos de Collection contados como uma ida ao servidor (getMore de cursores não é contado)
+COLLECTION_OPERATIONS = (
+    "find", "find_one", "find_one_and_update", "insert_one", "insert_many", "update_one",
+    "update_many", "replace_one", "delete_one", "delete_many", "bulk_write", "aggregate",
+    "count_documents", "distinct", "create_indexes"
+)
+
+
+def generate_orders(n, rng):
+    """Random (quantities, types, sizes) arrays for n orders"""
+    types = np.array(list(MATERIALS_BASE))
+    sizes = np.array(list(SIZE_RATIO))
+    return (
+        rng.integers(100, 201, n),
+        types[rng.integers(0, len(types), n)],
+        sizes[rng.integers(0, len(sizes), n)]
+    )
+
+
+def _format_order(fmt, quantity, clothing_type, size):
+    if fmt == LINE_FORMAT:
+        return f"{quantity} {clothing_type} {size}"
+    if fmt == COMPACT_FORMAT:
+        return f"{quantity}{clothing_type}{size}"
+    return f"{quantity} {clothing_type} do tamanho {size}"
+
+
+def write_order_file(path, fmt, n, seed=0):
+    """Writes n random orders in the given format, generated in chunks to bound memory"""
+    rng = np.random.default_rng(seed)
+    per_line = ORDERS_PER_LINE[fmt]
+    separator = "" if fmt == COMPACT_FORMAT else ", "
+    prefix = "Olá, eu gostaria de encomendar " if fmt == TEXT_FORMAT else ""
+    with open(path, "w") as output_file:
+        written = 0
+        while written < n:
+            count = min(GENERATE_CHUNK, n - written)
+            orders = [_format_order(fmt, *order) for order in zip(*generate_orders(count, rng))]
+            lines = (
+                prefix + separator.join(orders[start:start + per_line])
+                for start in range(0, count, per_line)
+            )
+            output_file.write("\n".join(lines) + "\n")
+            written += count
+    return path
+
+
+def time_call(function, repeat):
+    """Runs function `repeat` times and returns the timings plus its last result"""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return {
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.fmean(timings),
+        "runs": len(timings)
+    }, result
+
+
+class Results:
+    def __init__(self, verbose=True):
+        self.benchmarks = []
+        self.verbose = verbose
+
+    def add(self, name, params, seconds, units=None, **extra):
+        entry = {"name": name, "params": params, "seconds": seconds, **extra}
+        if units:
+            entry["units"] = units
+            entry["units_per_second"] = units / seconds["median"] if seconds["median"] else None
+        self.benchmarks.append(entry)
+        if self.verbose:
+            rate = f"  {entry['units_per_second']:,.0f}/s" if units and entry["units_per_second"] else ""
+            trips = f"  {extra['round_trips']} round trips" if "round_trips" in extra else ""
+            print(f"{name:<40} {json.dumps(params):<45} {seconds['median'] * 1000:10.2f} ms{rate}{trips}")
+
+
+# Ficheiros, BOM e simulação
+
+def bench_files(results, sizes, repeat, workdir, legacy_max):
+    bom = BOMTensor.from_constants()
+    for n in sizes:
+        for fmt in (LINE_FORMAT, COMPACT_FORMAT, TEXT_FORMAT):
+            path = write_order_file(os.path.join(workdir, f"encomenda_{fmt}_{n}.txt"), fmt, n)
+            params = {"orders": n, "format": fmt}
+
+            seconds, parsed = time_call(lambda: sum(1 for _ in parse_file(path)), repeat)
+            results.add("parse_file", params, seconds, units=n, parsed=parsed)
+
+            seconds, result = time_call(lambda: process_order_file(path), repeat)
+            results.add("ingest.process_order_file", params, seconds, units=n, days=len(result["day_usage"]))
+
+            seconds, _ = time_call(lambda: simulate_stock([result]), repeat)
+            results.add("ingest.simulate_stock", params, seconds, units=len(result["day_usage"]))
+            os.remove(path)
+
+        quantities, types, sizes_ = generate_orders(n, np.random.default_rng(1))
+        seconds, _ = time_call(lambda: bom.totals(types, sizes_, quantities), repeat)
+        results.add("BOMTensor.totals", {"orders": n}, seconds, units=n)
+
+        days = np.arange(n) // 10
+        seconds, usage = time_call(lambda: bom.totals(types, sizes_, quantities, groups=days), repeat)
+        results.add("BOMTensor.totals(by_day)", {"orders": n}, seconds, units=n)
+
+        simulator = StockSimulator({m: 2200 for m in bom.materials}, policy_from_constants())
+        for m, material in enumerate(bom.materials):
+            simulator.add_demand_series(material, usage[:, m])
+        seconds, _ = time_call(lambda: simulator.run(len(usage)), repeat)
+        results.add("StockSimulator.run", {"orders": n, "days": len(usage)}, seconds, units=len(usage))
+
+        if n <= legacy_max:
+            bench_legacy_main(results, n, repeat, workdir)
+
+
+def bench_legacy_main(results, n, repeat, workdir):
+    """data_processing.main as shipped: fixed file names in the working directory, verbose output"""
+    import data_processing
+
+    legacy_dir = os.path.join(workdir, f"legacy_{n}")
+    os.makedirs(legacy_dir, exist_ok=True)
+    for index, fmt in enumerate((LINE_FORMAT, COMPACT_FORMAT, TEXT_FORMAT), start=1):
+        write_order_file(os.path.join(legacy_dir, f"encomenda{index}.txt"), fmt, n // 3, seed=index)
+
+    def run():
+        cwd = os.getcwd()
+        os.chdir(legacy_dir)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                data_processing.main()
+        finally:
+            os.chdir(cwd)
+
+    seconds, _ = time_call(run, repeat)
+    results.add("data_processing.main", {"orders": n // 3 * 3}, seconds, units=n // 3 * 3)
+
+
+# Base de dados
+
+class RoundTripCounter:
+    """Counts collection calls (one per server round trip) made through mongomock"""
+
+    def __init__(self):
+        self.calls = Counter()
+        # mongomock chama os próprios métodos por dentro (ex: $lookup faz find): só conta a chamada exterior
+        self._inside = threading.local()
+
+    @contextlib.contextmanager
+    def patch(self, collection_class):
+        originals = {}
+        for operation in COLLECTION_OPERATIONS:
+            original = getattr(collection_class, operation, None)
+            if original is None:
+                continue
+            originals[operation] = original
+            setattr(collection_class, operation, self._wrap(operation, original))
+        try:
+            yield self
+        finally:
+            for operation, original in originals.items():
+                setattr(collection_class, operation, original)
+
+    def _wrap(self, operation, original):
+        def counted(collection, *args, **kwargs):
+            if getattr(self._inside, "active", False):
+                return original(collection, *args, **kwargs)
+            self.calls[operation] += 1
+            self._inside.active = True
+            try:
+                return original(collection, *args, **kwargs)
+            finally:
+                self._inside.active = False
+        return counted
+
+    def measure(self, function):
+        """Runs function once and returns (result, {operation: calls})"""
+        before = Counter(self.calls)
+        result = function()
+        return result, dict(self.calls - before)
+
+
+def _mongomock():
+    try:
+        import mongomock
+    except ImportError:
+        return None
+    return mongomock
+
+
+def _sample_encomendas(n, rng):
+    tipos = ["TSHIRT001", "CALCOES001"]
+    tamanhos = list(SIZE_RATIO)
+    return [
+        {
+            "id_encomenda": f"BENCH{i:07d}",
+            "data_criacao": f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}T{i % 24:02d}:00:00",
+            "cliente": {"nome": f"Cliente {i % 500}", "email": f"cliente{i % 500}@exemplo.pt"},
+            "itens": [
+                {"id_tipo": tipos[rng.integers(0, 2)], "tamanho": tamanhos[rng.integers(0, 5)],
+                 "quantidade": int(rng.integers(1, 20))}
+                for _ in range(int(rng.integers(1, 4)))
+            ],
+            "status": ["pendente", "em_producao", "concluida"][i % 3],
+            "valor_total": 100.0,
+            "prazo_entrega": f"2024-{1 + (i + 1) % 12:02d}-15"
+        }
+        for i in range(n)
+    ]
+
+
+def bench_db(results, encomendas, repeat):
+    mongomock = _mongomock()
+    if mongomock is None:
+        print("mongomock not installed: skipping DB benchmarks", file=sys.stderr)
+        return
+    import db as db_module
+
+    counter = RoundTripCounter()
+    original_client = db_module.MongoClient
+    db_module.MongoClient = mongomock.MongoClient
+    try:
+        with counter.patch(mongomock.collection.Collection):
+            handler = db_module.DatabaseHandler(db_name="benchmark")
+            for id_material in ("TECIDO001", "ALGODAO001", "FIO001", "POLIESTER001"):
+                handler.ajusta_estoque_material(id_material, 10 ** 9)
+
+            rng = np.random.default_rng(2)
+            documentos = _sample_encomendas(encomendas, rng)
+            seconds, _ = time_call(lambda: [handler.insere_encomenda(e) for e in documentos], 1)
+            results.add("DatabaseHandler.insere_encomenda", {"encomendas": encomendas}, seconds, units=encomendas)
+
+            itens = [item for encomenda in documentos[:50] for item in encomenda["itens"]]
+            cases = [
+                ("processa_producao", {}, lambda: handler.processa_producao("TSHIRT001", "M", 1)),
+                ("processa_producao_lote", {"itens": len(itens)}, lambda: handler.processa_producao_lote(itens)),
+                ("calcula_materiais_necessarios_lote", {"itens": len(itens)},
+                 lambda: handler.calcula_materiais_necessarios_lote(itens)),
+                ("verifica_disponibilidade_producao", {}, lambda: handler.verifica_disponibilidade_producao("TSHIRT001", "M", 1)),
+                ("get_quantidade_todos_materiais", {}, handler.get_quantidade_todos_materiais),
+                ("get_encomendas_paginadas", {"encomendas": encomendas, "limite": 100},
+                 lambda: handler.get_encomendas_paginadas({"status": "pendente"}, limite=100)),
+                ("procura_materiais", {"encomendas": encomendas},
+                 lambda: handler.procura_materiais(handler.filtro_encomendas(status="pendente"))),
+                ("resumo_encomendas", {"encomendas": encomendas}, handler.resumo_encomendas),
+            ]
+            for name, params, function in cases:
+                # Primeira chamada aquece caches (receitas, snapshot de estoque); as seguintes são medidas
+                function()
+                _, trips = counter.measure(function)
+                seconds, _ = time_call(function, repeat)
+                results.add(f"DatabaseHandler.{name}", params, seconds,
+                            round_trips=sum(trips.values()), operations=trips)
+            handler.close_connection()
+    finally:
+        db_module.MongoClient = original_client
+
+
+def bench_api(results, repeat):
+    mongomock = _mongomock()
+    try:
+        from fastapi.testclient import TestClient
+    except ImportError:
+        TestClient = None
+    if mongomock is None or TestClient is None:
+        print("mongomock or fastapi's TestClient not available: skipping API benchmarks", file=sys.stderr)
+        return
+    import db as db_module
+
+    counter = RoundTripCounter()
+    original_client = db_module.MongoClient
+    db_module.MongoClient = mongomock.MongoClient
+    try:
+        import api
+        with counter.patch(mongomock.collection.Collection), TestClient(api.app) as client:
+            client.post("/materiais/ajuste/", json={"id_material": "TECIDO001", "quantidade": 10 ** 9})
+            client.post("/materiais/ajuste/", json={"id_material": "ALGODAO001", "quantidade": 10 ** 9})
+            client.post("/materiais/ajuste/", json={"id_material": "FIO001", "quantidade": 10 ** 9})
+            client.post("/materiais/ajuste/", json={"id_material": "POLIESTER001", "quantidade": 10 ** 9})
+            # Lido depois dos ajustes (que mudam o snapshot), para o pedido condicional dar 304
+            etag = client.get("/materiais/quantidades/").headers.get("etag", "")
+            cases = [
+                ("GET /materiais/quantidades/", 200, lambda: client.get("/materiais/quantidades/")),
+                ("GET /materiais/quantidades/ (If-None-Match)", 304, lambda: client.get(
+                    "/materiais/quantidades/", headers={"If-None-Match": etag})),
+                ("GET /materiais/quantidade/{id}", 200, lambda: client.get("/materiais/quantidade/TECIDO001")),
+                ("GET /producao/materiais-necessarios", 200, lambda: client.get(
+                    "/producao/materiais-necessarios/TSHIRT001/M/10")),
+                ("POST /producao/processar", 200, lambda: client.post("/producao/processar/TSHIRT001/M/1")),
+            ]
+            for name, expected_status, function in cases:
+                # Um estado inesperado mediria outro caminho (ex: GET completo em vez do 304)
+                status_code = function().status_code
+                if status_code != expected_status:
+                    raise RuntimeError(f"api {name}: expected HTTP {expected_status}, got {status_code}")
+                _, trips = counter.measure(function)
+                seconds, response = time_call(function, repeat)
+                results.add(f"api {name}", {}, seconds, round_trips=sum(trips.values()),
+                            status_code=response.status_code)
+    finally:
+        db_module.MongoClient = original_client
+
+
+# Comparação com uma execução anterior
+
+def _key(benchmark):
+    return benchmark["name"], json.dumps(benchmark["params"], sort_keys=True)
+
+
+def compare(benchmarks, baseline, threshold):
+    """Benchmarks whose median time grew by more than `threshold` times the baseline"""
+    previous = {_key(b): b for b in baseline["benchmarks"]}
+    regressions = []
+    for benchmark in benchmarks:
+        old = previous.get(_key(benchmark))
+        if old is None or not old["seconds"]["median"]:
+            continue
+        ratio = benchmark["seconds"]["median"] / old["seconds"]["median"]
+        if ratio > threshold:
+            regressions.append({"name": benchmark["name"], "params": benchmark["params"], "ratio": ratio})
+    return regressions
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark parsing, BOM, simulation and DB hot paths")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma-separated numbers of orders (up to 10^7)")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per benchmark (median is reported)")
+    parser.add_argument("--legacy-max", type=int, default=100_000,
+                        help="Largest size for which data_processing.main is timed")
+    parser.add_argument("--encomendas", type=int, default=2000, help="Orders inserted for the DB benchmarks")
+    parser.add_argument("--skip", default="", help="Comma-separated groups to skip: files,db,api")
+    parser.add_argument("--workdir", help="Directory for the generated files (default: a temporary one)")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", help="Previous JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="Slowdown ratio over the baseline reported as a regression")
+    args = parser.parse_args(argv)
+
+    skip = {group for group in args.skip.split(",") if group}
+    sizes = [int(float(size)) for size in args.sizes.split(",") if size]
+    results = Results()
+
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        workdir = args.workdir or temporary_dir
+        os.makedirs(workdir, exist_ok=True)
+        if "files" not in skip:
+            bench_files(results, sizes, args.repeat, workdir, args.legacy_max)
+    if "db" not in skip:
+        bench_db(results, args.encomendas, args.repeat)
+    if "api" not in skip:
+        bench_api(results, args.repeat)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "sizes": sizes,
+            "repeat": args.repeat
+        },
+        "benchmarks": results.benchmarks
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results.benchmarks, json.load(baseline_file), args.threshold)
+        report["regressions"] = regressions
+        for regression in regressions:
+            print(f"REGRESSION {regression['name']} {json.dumps(regression['params'])}: "
+                  f"{regression['ratio']:.2f}x slower", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
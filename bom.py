@@ -0,0 +1,154 @@
+import numpy as np
+
+# Campos dos documentos de tipos_roupa para cada id_material (ver db.py)
+CAMPOS_MATERIAIS = {
+    "TECIDO001": "quantidade_tecido",
+    "ALGODAO001": "quantidade_algodao",
+    "FIO001": "quantidade_fio",
+    "POLIESTER001": "quantidade_poliester"
+}
+
+
+class BOMTensor:
+    """
+    Bill of materials as a dense type x size x material coefficient tensor.
+
+    Requirements for a whole batch of (type, size, quantity) rows are computed
+    in one vectorized pass instead of one dict loop per order.
+    """
+
+    def __init__(self, types, sizes, materials, coefficients):
+        self.types = list(types)
+        self.sizes = list(sizes)
+        self.materials = list(materials)
+        self.coefficients = np.asarray(coefficients, dtype=np.float64)
+        expected_shape = (len(self.types), len(self.sizes), len(self.materials))
+        if self.coefficients.shape != expected_shape:
+            raise ValueError(f"Coefficient tensor has shape {self.coefficients.shape}, expected {expected_shape}")
+
+        self._type_index = {name: i for i, name in enumerate(self.types)}
+        self._size_index = {name: i for i, name in enumerate(self.sizes)}
+        # Vista (tipo*tamanho) x material usada nos cálculos
+        self._flat = self.coefficients.reshape(-1, len(self.materials))
+
+    @classmethod
+    def from_constants(cls, materials_base=None, size_ratio=None):
+        """Builds the tensor from MATERIALS_BASE / SIZE_RATIO in data_processing"""
+        if materials_base is None or size_ratio is None:
+            from data_processing import MATERIALS_BASE, SIZE_RATIO
+            materials_base = MATERIALS_BASE if materials_base is None else materials_base
+            size_ratio = SIZE_RATIO if size_ratio is None else size_ratio
+
+        types = list(materials_base)
+        sizes = list(size_ratio)
+        materials = []
+        for base in materials_base.values():
+            for material in base:
+                if material not in materials:
+                    materials.append(material)
+
+        base = np.array([[materials_base[t].get(m, 0.0) for m in materials] for t in types], dtype=np.float64)
+        ratios = np.array([size_ratio[s] for s in sizes], dtype=np.float64)
+        return cls(types, sizes, materials, base[:, None, :] * ratios[None, :, None])
+
+    @classmethod
+    def from_tipos_roupa(cls, tipos_roupa, campos_materiais=None):
+        """
+        Constrói o tensor a partir dos documentos da coleção tipos_roupa.
+
+        Os tipos são indexados por id_tipo e os materiais por id_material.
+        """
+        campos_materiais = campos_materiais or CAMPOS_MATERIAIS
+        tipos_roupa = list(tipos_roupa)
+        types = [tipo["id_tipo"] for tipo in tipos_roupa]
+        sizes = []
+        for tipo in tipos_roupa:
+            for tamanho in tipo["materiais_necessarios"]["tamanhos"]:
+                if tamanho not in sizes:
+                    sizes.append(tamanho)
+
+        materials = list(campos_materiais)
+        coefficients = np.zeros((len(types), len(sizes), len(materials)), dtype=np.float64)
+        for t, tipo in enumerate(tipos_roupa):
+            for tamanho, quantidades in tipo["materiais_necessarios"]["tamanhos"].items():
+                s = sizes.index(tamanho)
+                for m, campo in enumerate(campos_materiais.values()):
+                    coefficients[t, s, m] = quantidades.get(campo, 0.0)
+        return cls(types, sizes, materials, coefficients)
+
+    def _encode(self, values, index, kind):
+        """Maps labels to tensor indices, touching Python only once per distinct label"""
+        try:
+            import pandas as pd
+        except ImportError:
+            uniques, inverse = np.unique(np.asarray(values, dtype=object).astype(str), return_inverse=True)
+        else:
+            # factorize usa hashing, bem mais rápido que ordenar strings
+            inverse, uniques = pd.factorize(np.asarray(values, dtype=object))
+            uniques = [str(u) for u in uniques]
+        return self._lookup(uniques, index, kind)[inverse].reshape(-1)
+
+    def _flat_indices(self, types, sizes):
+        type_idx = self._encode(types, self._type_index, "type")
+        size_idx = self._encode(sizes, self._size_index, "size")
+        return type_idx * len(self.sizes) + size_idx
+
+    def requirements(self, types, sizes, quantities):
+        """Returns an (N, materials) array with the requirements of each row"""
+        flat = self._flat_indices(types, sizes)
+        quantities = np.asarray(quantities, dtype=np.float64)
+        return self._flat[flat] * quantities[:, None]
+
+    def totals(self, types, sizes, quantities, groups=None, n_groups=None):
+        """
+        Returns the total requirement per material for all rows.
+
+        With `groups` (an integer label per row, e.g. the day) the result is a
+        (n_groups, materials) array with one total row per group.
+        """
+        return self._totals_flat(self._flat_indices(types, sizes), quantities, groups, n_groups)
+
+    def totals_from_codes(self, type_codes, type_labels, size_codes, size_labels, quantities,
+                          groups=None, n_groups=None):
+        """
+        Same as totals() for dictionary-encoded columns (e.g. Arrow/Parquet or
+        pandas categoricals): `*_codes` index into `*_labels`, so labels are
+        looked up once and the per-row work is integer-only.
+        """
+        type_lookup = self._lookup(type_labels, self._type_index, "type")
+        size_lookup = self._lookup(size_labels, self._size_index, "size")
+        flat = type_lookup[np.asarray(type_codes, dtype=np.intp)] * len(self.sizes)
+        flat += size_lookup[np.asarray(size_codes, dtype=np.intp)]
+        return self._totals_flat(flat, quantities, groups, n_groups)
+
+    @staticmethod
+    def _lookup(labels, index, kind):
+        labels = [str(label) for label in labels]
+        missing = [label for label in labels if label not in index]
+        if missing:
+            raise KeyError(f"Unknown {kind}: {', '.join(missing)}")
+        return np.array([index[label] for label in labels], dtype=np.intp)
+
+    def _totals_flat(self, flat, quantities, groups, n_groups):
+        quantities = np.asarray(quantities, dtype=np.float64)
+
+        if groups is None:
+            # Soma as quantidades por combinação tipo/tamanho e só depois multiplica
+            weights = np.bincount(flat, weights=quantities, minlength=self._flat.shape[0])
+            return weights @ self._flat
+
+        groups = np.asarray(groups, dtype=np.intp)
+        if n_groups is None:
+            n_groups = int(groups.max()) + 1 if groups.size else 0
+        result = np.empty((n_groups, len(self.materials)), dtype=np.float64)
+        for m in range(len(self.materials)):
+            result[:, m] = np.bincount(groups, weights=quantities * self._flat[flat, m], minlength=n_groups)
+        return result
+
+    def compute(self, rows, type_col="Type", size_col="Size", quantity_col="Quantity"):
+        """
+        Computes total material requirements for a DataFrame (or any mapping of
+        columns) of orders and returns them as a {material: amount} dict.
+        """
+        totals = self.totals(rows[type_col], rows[size_col], rows[quantity_col])
+        return dict(zip(self.materials, totals.tolist()))
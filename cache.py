@@ -0,0 +1,300 @@
+import hashlib
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+
+class TTLCache:
+    """
+    Cache em memória, read-through, com expiração por tempo (TTL),
+    invalidação explícita e contadores de acerto/falha.
+
+    Os valores devolvidos são partilhados entre chamadas e não devem ser
+    alterados por quem os lê.
+    """
+
+    def __init__(self, ttl=300, clock=time.monotonic):
+        self.ttl = ttl
+        self._clock = clock
+        self._entradas = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidacoes = 0
+        # Incrementada a cada invalidação, para não guardar valores lidos antes dela
+        self._geracao = 0
+
+    def _procura(self, chave, agora):
+        """Devolve (encontrado, valor) sem contar acessos; requer o lock"""
+        entrada = self._entradas.get(chave)
+        if entrada is None:
+            return False, None
+        valor, expira_em = entrada
+        if expira_em < agora:
+            del self._entradas[chave]
+            return False, None
+        return True, valor
+
+    def get(self, chave, carregar):
+        """
+        Devolve o valor em cache para a chave ou carrega-o com `carregar()`.
+        Valores None (ex: documento inexistente) não são guardados.
+        """
+        with self._lock:
+            encontrado, valor = self._procura(chave, self._clock())
+            if encontrado:
+                self.hits += 1
+                return valor
+            self.misses += 1
+            geracao = self._geracao
+
+        valor = carregar()
+        if valor is not None:
+            self._guarda({chave: valor}, geracao)
+        return valor
+
+    def get_many(self, chaves, carregar_varios):
+        """
+        Versão em lote de get: as chaves em falta são carregadas numa única
+        chamada a `carregar_varios(chaves_em_falta)`, que deve devolver um
+        dict chave -> valor.
+        """
+        resultado = {}
+        em_falta = []
+        with self._lock:
+            agora = self._clock()
+            for chave in chaves:
+                encontrado, valor = self._procura(chave, agora)
+                if encontrado:
+                    self.hits += 1
+                    resultado[chave] = valor
+                else:
+                    self.misses += 1
+                    em_falta.append(chave)
+            geracao = self._geracao
+
+        if em_falta:
+            carregados = carregar_varios(em_falta)
+            self._guarda(carregados, geracao)
+            resultado.update(carregados)
+        return resultado
+
+    def _guarda(self, valores, geracao):
+        """Guarda valores carregados, exceto se houve uma invalidação entretanto"""
+        with self._lock:
+            if geracao != self._geracao:
+                return
+            expira_em = self._clock() + self.ttl
+            for chave, valor in valores.items():
+                self._entradas[chave] = (valor, expira_em)
+
+    def invalidate(self, chave=None):
+        """Remove uma chave da cache, ou todas se chave for None"""
+        with self._lock:
+            self.invalidacoes += 1
+            self._geracao += 1
+            if chave is None:
+                self._entradas.clear()
+            else:
+                self._entradas.pop(chave, None)
+
+    def estatisticas(self):
+        """Contadores de utilização da cache"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+                "invalidacoes": self.invalidacoes,
+                "entradas": len(self._entradas),
+                "ttl": self.ttl
+            }
+
+
+def calcula_etag(valor):
+    """ETag forte a partir do conteúdo: igual em todas as réplicas para os mesmos dados"""
+    conteudo = json.dumps(valor, sort_keys=True, default=str).encode()
+    return '"' + hashlib.sha1(conteudo).hexdigest()[:20] + '"'
+
+
+class RegistoEscrita:
+    """
+    Alterações feitas por uma escrita, aplicadas ao snapshot quando ela termina.
+
+    Depois de aplicadas, `transicoes` tem, para cada delta, as quantidades
+    (anterior, atual) no snapshot, lidas sob o mesmo lock que as aplicou.
+    """
+
+    def __init__(self):
+        self.deltas = {}
+        self.valores = {}
+        self.invalidar = False
+        self.transicoes = {}
+
+    def soma(self, chave, delta):
+        self.deltas[chave] = self.deltas.get(chave, 0) + delta
+
+    def define(self, chave, valor):
+        self.valores[chave] = valor
+
+    def invalida(self):
+        self.invalidar = True
+
+
+class StockSnapshot:
+    """
+    Snapshot em memória das quantidades em estoque, mantido write-through.
+
+    As leituras nunca vão à base de dados enquanto o snapshot for válido. As
+    escritas correm dentro de `escrita()` e, quando terminam com sucesso,
+    aplicam ao snapshot os seus deltas ($inc), que comutam entre si e podem
+    por isso ser aplicados por qualquer ordem. Valores absolutos só são
+    aplicados se nenhuma outra escrita se cruzou com a atual; caso contrário
+    (ou em caso de erro) o snapshot é descartado.
+
+    O recarregamento espera que as escritas em curso terminem e impede novas
+    escritas enquanto lê (uma única consulta), para que o que é lido e os
+    deltas aplicados depois nunca se sobreponham.
+
+    Com `ttl` o snapshot é também recarregado periodicamente, para apanhar
+    escritas feitas por outros processos.
+    """
+
+    def __init__(self, ttl=None, clock=time.monotonic):
+        self.ttl = ttl
+        self._clock = clock
+        self._condicao = threading.Condition()
+        self._quantidades = None
+        self._etag = None
+        self._expira_em = None
+        # Incrementada no início e no fim de cada escrita e em cada invalidação
+        self._geracao = 0
+        self._escritas_pendentes = 0
+        self._a_carregar = False
+        self.hits = 0
+        self.misses = 0
+        self.atualizacoes = 0
+        self.invalidacoes = 0
+
+    def _valido(self):
+        return self._quantidades is not None and (self._expira_em is None or self._clock() < self._expira_em)
+
+    def _define(self, quantidades, etag=None, renova=True):
+        # Copy-on-write: o dict publicado nunca é alterado, pelo que pode ser lido sem lock
+        self._quantidades = quantidades
+        self._etag = etag or calcula_etag(quantidades)
+        if renova:
+            self._expira_em = self._clock() + self.ttl if self.ttl else None
+
+    def _invalida(self):
+        self.invalidacoes += 1
+        self._quantidades = None
+        self._etag = None
+
+    def get(self, carregar):
+        """
+        Devolve (quantidades, etag), carregando-as com `carregar()` (um dict
+        id -> quantidade) se o snapshot não for válido.
+        """
+        with self._condicao:
+            if self._valido():
+                self.hits += 1
+                return self._quantidades, self._etag
+            self.misses += 1
+            if self._a_carregar:
+                # Outro pedido já está a recarregar: espera pelo resultado dele
+                self._condicao.wait_for(lambda: not self._a_carregar)
+                if self._valido():
+                    return self._quantidades, self._etag
+                return self._carrega_sem_guardar(carregar)
+            self._a_carregar = True
+            self._condicao.wait_for(lambda: self._escritas_pendentes == 0)
+            geracao = self._geracao
+
+        try:
+            quantidades = dict(carregar())
+            etag = calcula_etag(quantidades)
+            with self._condicao:
+                if geracao == self._geracao:
+                    self._define(quantidades, etag)
+            return quantidades, etag
+        finally:
+            with self._condicao:
+                self._a_carregar = False
+                self._condicao.notify_all()
+
+    def _carrega_sem_guardar(self, carregar):
+        quantidades = dict(carregar())
+        return quantidades, calcula_etag(quantidades)
+
+    @contextmanager
+    def escrita(self):
+        """
+        Envolve uma escrita na base de dados. O bloco regista as alterações
+        feitas no RegistoEscrita devolvido (só depois de a escrita ter sucesso).
+        """
+        with self._condicao:
+            self._condicao.wait_for(lambda: not self._a_carregar)
+            self._escritas_pendentes += 1
+            self._geracao += 1
+            inicio = self._geracao
+        registo = RegistoEscrita()
+        try:
+            yield registo
+        except BaseException:
+            with self._condicao:
+                self._termina_escrita()
+                self._invalida()
+            raise
+
+        with self._condicao:
+            concorrente = self._geracao != inicio
+            self._termina_escrita()
+            if self._quantidades is None or not (registo.deltas or registo.valores or registo.invalidar):
+                return
+            if registo.invalidar or (registo.valores and concorrente):
+                self._invalida()
+                return
+            quantidades = dict(self._quantidades)
+            quantidades.update(registo.valores)
+            transicoes = {}
+            for chave, delta in registo.deltas.items():
+                if chave not in quantidades:
+                    # Material que o snapshot não conhece: recarrega tudo
+                    self._invalida()
+                    return
+                transicoes[chave] = (quantidades[chave], quantidades[chave] + delta)
+                quantidades[chave] += delta
+            registo.transicoes = transicoes
+            self.atualizacoes += 1
+            # Atualizações locais não adiam o recarregamento por TTL
+            self._define(quantidades, renova=False)
+
+    def _termina_escrita(self):
+        self._escritas_pendentes -= 1
+        self._geracao += 1
+        self._condicao.notify_all()
+
+    def atual(self):
+        """Quantidades atuais sem recarregar (None se o snapshot não for válido)"""
+        with self._condicao:
+            return self._quantidades if self._valido() else None
+
+    def invalidate(self):
+        with self._condicao:
+            self._geracao += 1
+            self._invalida()
+
+    def estatisticas(self):
+        with self._condicao:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+                "atualizacoes": self.atualizacoes,
+                "invalidacoes": self.invalidacoes,
+                "ttl": self.ttl
+            }
@@ -0,0 +1,22 @@
+import math
+
+# Constants provided for the challenge
+ORDER_COST = 10.0
+HOLDING_COST = 0.7
+LEAD_TIME = 7  # in days
+SAFETY_STOCK = 1000
+INITIAL_STOCK = 2200
+ANNUAL_DEMAND = 50000
+MATERIAL_PRICES = {
+    "tecido": 7.0,
+    "algodao": 5.5,
+    "fio": 4.5,
+    "poliester": 10.0
+}
+
+# Function to calculate EOQ and reorder point
+def calculate_economic_order_quantity():
+    return math.sqrt((2 * ANNUAL_DEMAND * ORDER_COST) / HOLDING_COST)
+
+def calculate_reorder_point():
+    return ((ANNUAL_DEMAND / 365) * LEAD_TIME) + SAFETY_STOCK
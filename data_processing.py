@@ -1,20 +1,19 @@
 import pandas as pd
 import re
-import math
-
-# Constants provided for the challenge
-ORDER_COST = 10.0
-HOLDING_COST = 0.7
-LEAD_TIME = 7  # in days
-SAFETY_STOCK = 1000
-INITIAL_STOCK = 2200
-ANNUAL_DEMAND = 50000
-MATERIAL_PRICES = {
-    "tecido": 7.0,
-    "algodao": 5.5,
-    "fio": 4.5,
-    "poliester": 10.0
-}
+
+# Constants provided for the challenge and the EOQ / reorder point formulas
+# live in constants.py, which does not need pandas (the API uses them too)
+from constants import (
+    ANNUAL_DEMAND,
+    HOLDING_COST,
+    INITIAL_STOCK,
+    LEAD_TIME,
+    MATERIAL_PRICES,
+    ORDER_COST,
+    SAFETY_STOCK,
+    calculate_economic_order_quantity,
+    calculate_reorder_point
+)
 
 # Size ratio multiplier and base requirements per type
 SIZE_RATIO = {"XS": 0.5, "S": 0.75, "M": 1.0, "L": 1.5, "XL": 2.0}
@@ -25,13 +24,6 @@ MATERIALS_BASE = {
     "Calcas": {"tecido": 1.2, "algodao": 0.95, "fio": 0.35, "poliester": 1.2}
 }
 
-# Function to calculate EOQ and reorder point
-def calculate_economic_order_quantity():
-    return math.sqrt((2 * ANNUAL_DEMAND * ORDER_COST) / HOLDING_COST)
-
-def calculate_reorder_point():
-    return ((ANNUAL_DEMAND / 365) * LEAD_TIME) + SAFETY_STOCK
-
 # Function to accumulate material quantities for an order
 def calculate_materials_needed(order):
     materials_needed = {}
@@ -41,30 +33,80 @@ def calculate_materials_needed(order):
     return materials_needed
 
 
-def request_materials(eoq, orders, material):
+class MaterialAccumulator:
+    """Running per-material totals, folded in one order at a time.
+
+    Replaces re-running calculate_materials_needed over the whole order
+    history every day: each order is added once, in O(1), to the running
+    totals and to the current day's delta.
+    """
+
+    def __init__(self, materials=None):
+        self.materials = list(materials or MATERIAL_PRICES)
+        self.reset()
+
+    def reset(self):
+        """Clears the running totals and the current day's delta"""
+        self.totals = {material: 0 for material in self.materials}
+        self.day_delta = {material: 0 for material in self.materials}
+
+    def add(self, order):
+        """Folds a single order into the running totals and the day's delta"""
+        self.add_materials(calculate_materials_needed(order))
+
+    def add_materials(self, materials):
+        """Folds precomputed material amounts (e.g. from a parsed file) in"""
+        for material, amount in materials.items():
+            self.totals[material] += amount
+            self.day_delta[material] += amount
+
+    def next_day(self):
+        """Closes the current day and returns its material delta"""
+        delta = self.day_delta
+        self.day_delta = {material: 0 for material in self.materials}
+        return delta
+
+
+def request_materials(eoq, orders, material, replenishment=None, day=None, verbose=True):
     # orders[material] -= eoq
-    print(f"EOQ: {eoq}")
-    # Send PDF
+    if verbose:
+        print(f"EOQ: {eoq}")
+    # A nota de encomenda é gerada pelo pipeline de reposição (agrupada por fornecedor)
+    if replenishment is not None:
+        replenishment.trigger(day, material, eoq)
     return {material: eoq}
 
 
-def check_reorder_point(orders, stock, day, reorder_point, pending_orders):
-    # Inicialize o acumulador de materiais para o dia
-    materials_acc = {"tecido": 0, "algodao": 0, "fio": 0, "poliester": 0}
-    
-    # Acumular materiais necessários para os pedidos do dia
-    for order in orders:
-        required_materials = calculate_materials_needed(order)
-        for material, amount in required_materials.items():
-            materials_acc[material] += amount
+def check_reorder_point(orders, stock, day, reorder_point, pending_orders, accumulator=None, verbose=True,
+                        demand_stats=None, replenishment=None):
+    day_delta = None
+    if accumulator is not None:
+        # Totais já acumulados incrementalmente, sem percorrer o histórico
+        materials_acc = dict(accumulator.totals)
+        # Consumo real do dia (só as encomendas novas), usado nas estatísticas de procura
+        day_delta = accumulator.next_day()
+    else:
+        # Inicialize o acumulador de materiais para o dia
+        materials_acc = {"tecido": 0, "algodao": 0, "fio": 0, "poliester": 0}
+
+        # Acumular materiais necessários para os pedidos do dia
+        for order in orders:
+            required_materials = calculate_materials_needed(order)
+            for material, amount in required_materials.items():
+                materials_acc[material] += amount
     
-    print(f"Day {day}: Material accumulation for the day: {materials_acc}")
+    if verbose:
+        print(f"Day {day}: Material accumulation for the day: {materials_acc}")
+
+    if replenishment is not None:
+        replenishment.advance(day)
 
     # Verificar se há entregas pendentes para o dia e atualizar o estoque
     if day in pending_orders:
         for material, amount in pending_orders.pop(day).items():
             stock[material] += amount
-            print(f"Delivered {amount} of {material} to stock on day {day}. Current stock after delivery: {stock[material]}")
+            if verbose:
+                print(f"Delivered {amount} of {material} to stock on day {day}. Current stock after delivery: {stock[material]}")
 
     
     # Verificar se o ponto de encomenda foi atingido para cada material
@@ -73,9 +115,15 @@ def check_reorder_point(orders, stock, day, reorder_point, pending_orders):
         # Calcular estoque efetivo após considerar a demanda do dia
         effective_stock = stock[material] - required
         
+        # Ponto de encomenda e EOQ por material, se houver estatísticas de procura
+        material_reorder_point = demand_stats.reorder_point(material) if demand_stats else reorder_point
+
         # Verificar necessidade de reorder apenas se o estoque efetivo está abaixo do ponto de encomenda
-        if effective_stock <= reorder_point:
-            eoq = calculate_economic_order_quantity()
+        if effective_stock <= material_reorder_point:
+            if demand_stats:
+                eoq = demand_stats.economic_order_quantity(material)
+            else:
+                eoq = calculate_economic_order_quantity()
             delivery_day = day + LEAD_TIME
             
             # Encomendar apenas se não houver encomenda já pendente para esse material
@@ -83,7 +131,10 @@ def check_reorder_point(orders, stock, day, reorder_point, pending_orders):
                 pending_orders[delivery_day] = {}
             if material not in pending_orders[delivery_day]:
                 pending_orders[delivery_day][material] = eoq
-                print(f"Order placed for {eoq} units of {material}, arriving on day {delivery_day}")
+                if verbose:
+                    print(f"Order placed for {eoq} units of {material}, arriving on day {delivery_day}")
+                if replenishment is not None:
+                    request_materials(eoq, pending_orders[delivery_day], material, replenishment, day, verbose)
 
     # Atualizar o estoque subtraindo a quantidade necessária para o dia
     today_materials = calculate_materials_needed(orders[-1])
@@ -92,7 +143,12 @@ def check_reorder_point(orders, stock, day, reorder_point, pending_orders):
             
     for material, used in today_materials.items():
         stock[material] -= used  # subtrai apenas o necessário para o dia
-        print(f"Stock of {material} after using {used} units for day {day}: {stock[material]}")
+        if verbose:
+            print(f"Stock of {material} after using {used} units for day {day}: {stock[material]}")
+
+    if demand_stats:
+        # Sem acumulador não se sabe quais encomendas são do dia: usa o consumo subtraído ao estoque
+        demand_stats.update_day(day_delta if day_delta is not None else today_materials)
     
     return stock
 
@@ -109,32 +165,40 @@ def main():
     }  # Initial stock
     
     pending_orders = {}  # Pending orders by day
+    accumulator = MaterialAccumulator()
     
     day = 0
     for file_name in ['./encomenda1.txt', './encomenda2.txt', './encomenda3.txt']:
         with open(file_name, 'r') as file:
             orders = []
+            accumulator.reset()
             for line in file:
                 line = line.strip()
                 day += 1
+                line_orders = []
 
                 # Format handling (process each order line based on the specified format)
                 if re.match(r'^\d+\s+\w+\s+\w+$', line):
                     quantity, clothing_type, size = line.split()
-                    orders.append({"Quantity": int(quantity), "Type": clothing_type, "Size": size.upper()})
+                    line_orders.append({"Quantity": int(quantity), "Type": clothing_type, "Size": size.upper()})
                 elif re.match(r'^\d+\w+\w+$', line):
                     matches = re.findall(r'(\d+[A-Z][a-z]+[A-Z]+)', line)
                     for match in matches:
                         order = re.match(r'(\d+)([A-Z][a-z]+)([A-Z]+)', match)
                         if order:
-                            orders.append({"Quantity": int(order.group(1)), "Type": order.group(2), "Size": order.group(3).upper()})
+                            line_orders.append({"Quantity": int(order.group(1)), "Type": order.group(2), "Size": order.group(3).upper()})
                 else:
                     matches = re.findall(r'(\d+)\s+(\w+)\s+do tamanho\s+(\w+)', line)
                     for match in matches:
-                        orders.append({"Quantity": int(match[0]), "Type": match[1], "Size": match[2].upper()})
+                        line_orders.append({"Quantity": int(match[0]), "Type": match[1], "Size": match[2].upper()})
+
+                # Fold only the new orders into the running totals
+                for order in line_orders:
+                    accumulator.add(order)
+                orders.extend(line_orders)
                 
                 # Check reorder point and update stock
-                stock = check_reorder_point(orders, stock, day, reorder_point, pending_orders)
+                stock = check_reorder_point(orders, stock, day, reorder_point, pending_orders, accumulator)
 
     # Output final stock levels
     print("Final stock levels:", stock)
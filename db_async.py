@@ -0,0 +1,75 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from db import DatabaseHandler
+
+
+class AsyncDatabaseHandler:
+    """
+    Variante assíncrona do DatabaseHandler, com a mesma interface: cada
+    método devolve uma corrotina.
+
+    As chamadas ao pymongo correm num pool de threads com o mesmo tamanho do
+    pool de ligações ao MongoDB (é também assim que o Motor funciona por
+    dentro), pelo que os handlers do FastAPI deixam de bloquear o event loop
+    e o número de pedidos concorrentes escala com o pool.
+    """
+
+    def __init__(self, db_name="scitech", max_pool_size=None, min_pool_size=None, event_listeners=None):
+        self.db_name = db_name
+        self.max_pool_size = max_pool_size
+        self.min_pool_size = min_pool_size
+        self.event_listeners = event_listeners
+        # A ligação só é aberta em conecta(), chamada no arranque da API
+        self.handler = None
+        self._executor = None
+
+    async def conecta(self):
+        """Abre a ligação ao MongoDB (índices e dados base incluídos) fora do event loop"""
+        if self.handler is not None:
+            return
+        loop = asyncio.get_running_loop()
+        self.handler = await loop.run_in_executor(None, functools.partial(
+            DatabaseHandler,
+            self.db_name,
+            max_pool_size=self.max_pool_size,
+            min_pool_size=self.min_pool_size,
+            event_listeners=self.event_listeners
+        ))
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.handler.max_pool_size,
+            thread_name_prefix="mongodb"
+        )
+
+    def __getattr__(self, nome):
+        if self.handler is None:
+            raise RuntimeError("AsyncDatabaseHandler não está ligado; chame conecta() primeiro")
+        atributo = getattr(self.handler, nome)
+        if not callable(atributo):
+            return atributo
+
+        @functools.wraps(atributo)
+        async def metodo(*args, **kwargs):
+            # Handler e executor lidos a cada chamada: o wrapper sobrevive a close_connection/conecta
+            if self.handler is None:
+                raise RuntimeError("AsyncDatabaseHandler não está ligado; chame conecta() primeiro")
+            funcao = getattr(self.handler, nome)
+            loop = asyncio.get_running_loop()
+            # Corre no contexto do pedido: as métricas contam os comandos MongoDB de cada pedido
+            contexto = contextvars.copy_context()
+            return await loop.run_in_executor(
+                self._executor, functools.partial(contexto.run, funcao, *args, **kwargs)
+            )
+
+        # Guarda o wrapper para não o recriar a cada chamada
+        setattr(self, nome, metodo)
+        return metodo
+
+    async def close_connection(self):
+        if self.handler is None:
+            return
+        self.handler.close_connection()
+        self._executor.shutdown(wait=False)
+        self.handler = None
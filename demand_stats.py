@@ -0,0 +1,115 @@
+import math
+from collections import deque
+
+from data_processing import (
+    HOLDING_COST,
+    LEAD_TIME,
+    MATERIAL_PRICES,
+    ORDER_COST,
+    calculate_economic_order_quantity,
+    calculate_reorder_point
+)
+
+# z para um nível de serviço de ~95% (procura normal durante o prazo de entrega)
+DEFAULT_SERVICE_Z = 1.65
+
+
+class DemandStatistics:
+    """
+    Rolling per-material daily consumption statistics, with EOQ and reorder
+    point recomputed per material from observed demand.
+
+    Each call to `update_day` folds one day of consumption in O(materials):
+    a window of the last `window` days is kept with running sums, so mean and
+    variance never rescan history.
+
+    The holding cost of each material scales HOLDING_COST by its price
+    relative to the average price, so cheap materials are held in larger
+    batches than expensive ones. Until `min_days` days have been observed the
+    global constants from data_processing are used.
+    """
+
+    def __init__(self, materials=None, window=90, min_days=7, prices=None, order_cost=ORDER_COST,
+                 holding_cost=HOLDING_COST, lead_time=LEAD_TIME, service_z=DEFAULT_SERVICE_Z):
+        self.prices = dict(prices or MATERIAL_PRICES)
+        self.materials = list(materials or self.prices)
+        self.window = window
+        self.min_days = min_days
+        self.order_cost = order_cost
+        self.lead_time = lead_time
+        self.service_z = service_z
+
+        mean_price = sum(self.prices.values()) / len(self.prices)
+        self.holding_costs = {
+            material: holding_cost * self.prices.get(material, mean_price) / mean_price
+            for material in self.materials
+        }
+
+        self._values = {material: deque() for material in self.materials}
+        self._sum = dict.fromkeys(self.materials, 0.0)
+        self._sum_sq = dict.fromkeys(self.materials, 0.0)
+        self.days = 0
+
+    def update_day(self, consumption):
+        """Adds one day of consumption ({material: amount}; missing materials count as 0)"""
+        for material in self.materials:
+            amount = float(consumption.get(material, 0.0))
+            values = self._values[material]
+            values.append(amount)
+            self._sum[material] += amount
+            self._sum_sq[material] += amount * amount
+            if len(values) > self.window:
+                old = values.popleft()
+                self._sum[material] -= old
+                self._sum_sq[material] -= old * old
+        self.days += 1
+
+    def mean(self, material):
+        """Mean daily consumption over the window"""
+        n = len(self._values[material])
+        return self._sum[material] / n if n else 0.0
+
+    def variance(self, material):
+        """Sample variance of daily consumption over the window"""
+        n = len(self._values[material])
+        if n < 2:
+            return 0.0
+        mean = self._sum[material] / n
+        # Somas acumuladas podem dar valores ligeiramente negativos por arredondamento
+        return max((self._sum_sq[material] - n * mean * mean) / (n - 1), 0.0)
+
+    def std(self, material):
+        return math.sqrt(self.variance(material))
+
+    def ready(self):
+        return self.days >= self.min_days
+
+    def economic_order_quantity(self, material):
+        """EOQ for a material from its observed annual demand and holding cost (static EOQ without demand)"""
+        if not self.ready():
+            return calculate_economic_order_quantity()
+        annual_demand = self.mean(material) * 365
+        if annual_demand <= 0:
+            # Sem procura observada na janela: quantidade estática, nunca uma encomenda de 0 unidades
+            return calculate_economic_order_quantity()
+        return math.sqrt((2 * annual_demand * self.order_cost) / self.holding_costs[material])
+
+    def reorder_point(self, material):
+        """Lead-time demand plus safety stock for the chosen service level"""
+        if not self.ready():
+            return calculate_reorder_point()
+        lead_time_demand = self.mean(material) * self.lead_time
+        safety_stock = self.service_z * self.std(material) * math.sqrt(self.lead_time)
+        return lead_time_demand + safety_stock
+
+    def snapshot(self):
+        """Current statistics, EOQ and reorder point per material"""
+        return {
+            material: {
+                "mean_daily": self.mean(material),
+                "std_daily": self.std(material),
+                "eoq": self.economic_order_quantity(material),
+                "reorder_point": self.reorder_point(material)
+            }
+            for material in self.materials
+        }
@@ -0,0 +1,69 @@
+import asyncio
+import itertools
+
+
+class StockFeed:
+    """
+    Difusão de eventos de estoque para clientes ligados (SSE).
+
+    `publica` pode ser chamado de qualquer thread (as escritas ao MongoDB
+    correm no pool de threads do AsyncDatabaseHandler): o evento é entregue
+    no event loop com call_soon_threadsafe.
+
+    Cada cliente tem uma fila limitada. Um cliente lento que a encha perde os
+    eventos pendentes e recebe um único evento "sincroniza", que o leva a
+    pedir de novo o estado completo; assim um cliente lento nunca atrasa os
+    outros nem faz crescer a memória.
+    """
+
+    def __init__(self, tamanho_fila=100):
+        self.tamanho_fila = tamanho_fila
+        self._loop = None
+        self._clientes = set()
+        self._ids = itertools.count(1)
+        self.eventos_publicados = 0
+        self.eventos_descartados = 0
+
+    def liga(self, loop):
+        """Associa o feed ao event loop da API (no arranque)"""
+        self._loop = loop
+
+    def subscreve(self):
+        """Nova fila de eventos para um cliente; chamar no event loop"""
+        fila = asyncio.Queue(maxsize=self.tamanho_fila)
+        self._clientes.add(fila)
+        return fila
+
+    def cancela(self, fila):
+        self._clientes.discard(fila)
+
+    def publica(self, evento):
+        """Publica um evento (dict); seguro a partir de qualquer thread"""
+        loop = self._loop
+        if loop is None or not self._clientes or loop.is_closed():
+            return
+        evento = {"id": next(self._ids), **evento}
+        try:
+            loop.call_soon_threadsafe(self._entrega, evento)
+        except RuntimeError:
+            # Event loop já fechado (encerramento da API)
+            pass
+
+    def _entrega(self, evento):
+        self.eventos_publicados += 1
+        for fila in list(self._clientes):
+            try:
+                fila.put_nowait(evento)
+            except asyncio.QueueFull:
+                self.eventos_descartados += fila.qsize() + 1
+                while not fila.empty():
+                    fila.get_nowait()
+                fila.put_nowait({"id": evento["id"], "tipo": "sincroniza"})
+
+    def estatisticas(self):
+        return {
+            "clientes": len(self._clientes),
+            "tamanho_fila": self.tamanho_fila,
+            "eventos_publicados": self.eventos_publicados,
+            "eventos_descartados": self.eventos_descartados
+        }
@@ -0,0 +1,186 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from bom import BOMTensor
+from data_processing import (
+    INITIAL_STOCK,
+    MATERIAL_PRICES,
+    MaterialAccumulator,
+    calculate_reorder_point,
+    check_reorder_point
+)
+from demand_stats import DemandStatistics
+from order_parser import find_order_files, parse_file
+from order_store import OrderStore
+from replenishment import DEFAULT_WINDOW, ReplenishmentPipeline
+
+_BOM = None
+
+
+def _get_bom():
+    """BOM tensor built once per worker process"""
+    global _BOM
+    if _BOM is None:
+        _BOM = BOMTensor.from_constants()
+    return _BOM
+
+
+def process_order_file(file_name):
+    """
+    Parses and costs a single order file.
+
+    Each line of the file is one simulation day, as in data_processing.main().
+    Returns a dict with the per-day material usage (days x materials), the last
+    order seen up to each day and the file's total material cost.
+    """
+    bom = _get_bom()
+    known_types = set(bom.types)
+    known_sizes = set(bom.sizes)
+
+    types, sizes, quantities, lines = [], [], [], []
+    last_order_by_line = {}
+    unparsed = []
+    rejected = 0
+    for record in parse_file(file_name, on_error=unparsed.append):
+        if record.type not in known_types or record.size not in known_sizes:
+            rejected += 1
+            continue
+        types.append(record.type)
+        sizes.append(record.size)
+        quantities.append(record.quantity)
+        lines.append(record.line_no - 1)
+        last_order_by_line[record.line_no - 1] = record.as_dict()
+
+    n_days = max(lines) + 1 if lines else 0
+    day_usage = bom.totals(types, sizes, quantities, groups=lines, n_groups=n_days)
+
+    # Última encomenda conhecida em cada dia (linhas vazias repetem a anterior)
+    last_orders = []
+    last_order = None
+    for day in range(n_days):
+        last_order = last_order_by_line.get(day, last_order)
+        last_orders.append(last_order)
+
+    prices = np.array([MATERIAL_PRICES[m] for m in bom.materials])
+    material_totals = day_usage.sum(axis=0)
+    return {
+        "file": file_name,
+        "orders": len(quantities),
+        "unparsed": len(unparsed),
+        "rejected": rejected,
+        "materials": bom.materials,
+        "day_usage": day_usage,
+        "order_columns": {"Line": lines, "Quantity": quantities, "Type": types, "Size": sizes},
+        "last_orders": last_orders,
+        "material_totals": dict(zip(bom.materials, material_totals.tolist())),
+        "cost": float(material_totals @ prices)
+    }
+
+
+def ingest_files(file_names, workers=None):
+    """
+    Parses and costs files across a process pool.
+
+    Results come back in the same order as `file_names`, regardless of which
+    worker finishes first, so the merged day order is deterministic.
+    """
+    if workers == 1 or len(file_names) <= 1:
+        return [process_order_file(file_name) for file_name in file_names]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(process_order_file, file_names))
+
+
+def store_results(store, results):
+    """
+    Appends the parsed orders to an OrderStore, numbering days as
+    simulate_stock does (one day per line, continuing across files).
+    """
+    day_offset = 0
+    for result in results:
+        columns = result["order_columns"]
+        store.append_orders({
+            "Day": [day_offset + line + 1 for line in columns["Line"]],
+            "Quantity": columns["Quantity"],
+            "Type": columns["Type"],
+            "Size": columns["Size"],
+            "Source": [result["file"]] * len(columns["Line"])
+        })
+        day_offset += len(result["day_usage"])
+
+
+def simulate_stock(results, verbose=False, demand_stats=None, replenishment=None):
+    """
+    Runs the reorder-point simulation over the merged per-file results.
+    With `demand_stats` (a DemandStatistics) EOQ and reorder point are
+    computed per material from the observed consumption; with `replenishment`
+    (a ReplenishmentPipeline) reorders are turned into supplier orders.
+    """
+    reorder_point = calculate_reorder_point()
+    stock = {material: INITIAL_STOCK for material in MATERIAL_PRICES}
+    pending_orders = {}
+    accumulator = MaterialAccumulator()
+
+    day = 0
+    for result in results:
+        accumulator.reset()
+        for usage, last_order in zip(result["day_usage"], result["last_orders"]):
+            day += 1
+            accumulator.add_materials(dict(zip(result["materials"], usage.tolist())))
+            if last_order is None:
+                continue
+            stock = check_reorder_point([last_order], stock, day, reorder_point, pending_orders,
+                                        accumulator, verbose=verbose, demand_stats=demand_stats,
+                                        replenishment=replenishment)
+    return stock, day
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest encomenda files in parallel and simulate stock")
+    parser.add_argument("path", help="Directory with order files or a glob (e.g. 'orders/*.txt')")
+    parser.add_argument("--pattern", default="encomenda*.txt", help="File pattern used when path is a directory")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument("--verbose", action="store_true", help="Print every simulation step")
+    parser.add_argument("--per-material-eoq", action="store_true",
+                        help="Use EOQ and reorder points computed per material from observed demand")
+    parser.add_argument("--store", metavar="DIR", help="Append the parsed orders to the order store in this directory")
+    parser.add_argument("--supplier-orders", metavar="DIR",
+                        help="Generate supplier order PDFs for the reorders into this directory")
+    parser.add_argument("--order-window", type=int, default=DEFAULT_WINDOW,
+                        help="Days over which reorders to the same supplier are grouped into one order")
+    args = parser.parse_args(argv)
+
+    file_names = find_order_files(args.path, args.pattern)
+    if not file_names:
+        parser.error(f"No order files found in {args.path}")
+
+    results = ingest_files(file_names, workers=args.workers)
+    for result in results:
+        print(f"{result['file']}: {result['orders']} orders, {result['unparsed']} unparsed, "
+              f"{result['rejected']} rejected, cost EUR {result['cost']:.2f}")
+    if args.store:
+        store_results(OrderStore(args.store), results)
+
+    demand_stats = DemandStatistics() if args.per_material_eoq else None
+    replenishment = None
+    if args.supplier_orders:
+        replenishment = ReplenishmentPipeline(window=args.order_window, output_dir=args.supplier_orders)
+    stock, days = simulate_stock(results, verbose=args.verbose, demand_stats=demand_stats,
+                                 replenishment=replenishment)
+    print(f"Simulated {days} days across {len(results)} files")
+    print("Final stock levels:", stock)
+    if demand_stats:
+        for material, stats in demand_stats.snapshot().items():
+            print(f"{material}: mean {stats['mean_daily']:.1f}/day, EOQ {stats['eoq']:.1f}, "
+                  f"reorder point {stats['reorder_point']:.1f}")
+    if replenishment:
+        paths = replenishment.close()
+        for order, path in zip(replenishment.orders, paths):
+            print(f"Supplier order {order['name']}: {order['triggers']} reorders, "
+                  f"EUR {order['total_cost']:.2f} -> {path}")
+
+
+if __name__ == "__main__":
+    main()
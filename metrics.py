@@ -0,0 +1,328 @@
+import bisect
+import contextvars
+import sys
+import threading
+import time
+from collections import Counter
+
+from pymongo import monitoring
+
+# Limites dos histogramas (segundos e número de comandos por pedido)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128)
+
+# Contador de comandos MongoDB do pedido HTTP atual. É um objeto mutável: o
+# AsyncDatabaseHandler corre o pymongo numa cópia do contexto (copy_context),
+# que partilha a mesma instância, pelo que as contagens feitas na thread do
+# pool chegam ao middleware.
+_pedido_atual = contextvars.ContextVar("metricas_pedido", default=None)
+
+
+class _Pedido:
+    __slots__ = ("comandos", "tempo_mongo")
+
+    def __init__(self):
+        self.comandos = 0
+        self.tempo_mongo = 0.0
+
+
+class Histogram:
+    """Histograma cumulativo no formato do Prometheus (não thread-safe; usar sob o lock do registo)"""
+
+    __slots__ = ("limites", "contagens", "soma", "total")
+
+    def __init__(self, limites):
+        self.limites = limites
+        self.contagens = [0] * (len(limites) + 1)
+        self.soma = 0.0
+        self.total = 0
+
+    def observa(self, valor):
+        self.contagens[bisect.bisect_left(self.limites, valor)] += 1
+        self.soma += valor
+        self.total += 1
+
+    def linhas(self, nome, etiquetas):
+        acumulado = 0
+        for limite, contagem in zip(self.limites, self.contagens):
+            acumulado += contagem
+            yield f'{nome}_bucket{{{etiquetas},le="{limite}"}} {acumulado}'
+        yield f'{nome}_bucket{{{etiquetas},le="+Inf"}} {self.total}'
+        yield f"{nome}_sum{{{etiquetas}}} {self.soma}"
+        yield f"{nome}_count{{{etiquetas}}} {self.total}"
+
+
+def _etiquetas(**valores):
+    return ",".join(
+        f'{chave}="{str(valor).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for chave, valor in valores.items()
+    )
+
+
+class MetricsRegistry:
+    """
+    Métricas da API e do MongoDB, em memória, exportadas em texto Prometheus.
+
+    - latência por rota/método/status (histograma)
+    - comandos MongoDB por pedido e tempo passado no MongoDB por pedido, por rota
+    - comandos MongoDB por coleção e operação: contagem, falhas e duração
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latencias = {}
+        self._comandos_por_pedido = {}
+        self._tempo_mongo_por_pedido = {}
+        self._comandos = {}
+        self._falhas = Counter()
+
+    def observa_pedido(self, metodo, rota, status, duracao, pedido):
+        with self._lock:
+            chave = (metodo, rota, status)
+            histograma = self._latencias.get(chave)
+            if histograma is None:
+                histograma = self._latencias[chave] = Histogram(LATENCY_BUCKETS)
+            histograma.observa(duracao)
+
+            chave = (metodo, rota)
+            if chave not in self._comandos_por_pedido:
+                self._comandos_por_pedido[chave] = Histogram(COUNT_BUCKETS)
+                self._tempo_mongo_por_pedido[chave] = Histogram(LATENCY_BUCKETS)
+            self._comandos_por_pedido[chave].observa(pedido.comandos)
+            self._tempo_mongo_por_pedido[chave].observa(pedido.tempo_mongo)
+
+    def observa_comando(self, colecao, comando, duracao, sucesso):
+        with self._lock:
+            chave = (colecao, comando)
+            histograma = self._comandos.get(chave)
+            if histograma is None:
+                histograma = self._comandos[chave] = Histogram(LATENCY_BUCKETS)
+            histograma.observa(duracao)
+            if not sucesso:
+                self._falhas[chave] += 1
+
+    def resumo_comandos(self):
+        """Contagem e duração total por (coleção, operação)"""
+        with self._lock:
+            return {
+                f"{colecao}.{comando}": {
+                    "comandos": histograma.total,
+                    "falhas": self._falhas[(colecao, comando)],
+                    "duracao_total": histograma.soma
+                }
+                for (colecao, comando), histograma in self._comandos.items()
+            }
+
+    def prometheus(self):
+        """Todas as métricas no formato de texto do Prometheus (versão 0.0.4)"""
+        linhas = []
+        with self._lock:
+            linhas += [
+                "# HELP http_request_duration_seconds Latência dos pedidos HTTP por rota",
+                "# TYPE http_request_duration_seconds histogram"
+            ]
+            for (metodo, rota, status), histograma in sorted(self._latencias.items()):
+                linhas += histograma.linhas("http_request_duration_seconds",
+                                            _etiquetas(method=metodo, route=rota, status=status))
+
+            linhas += [
+                "# HELP http_request_mongodb_commands Comandos MongoDB por pedido HTTP",
+                "# TYPE http_request_mongodb_commands histogram"
+            ]
+            for (metodo, rota), histograma in sorted(self._comandos_por_pedido.items()):
+                linhas += histograma.linhas("http_request_mongodb_commands", _etiquetas(method=metodo, route=rota))
+
+            linhas += [
+                "# HELP http_request_mongodb_seconds Tempo passado no MongoDB por pedido HTTP",
+                "# TYPE http_request_mongodb_seconds histogram"
+            ]
+            for (metodo, rota), histograma in sorted(self._tempo_mongo_por_pedido.items()):
+                linhas += histograma.linhas("http_request_mongodb_seconds", _etiquetas(method=metodo, route=rota))
+
+            linhas += [
+                "# HELP mongodb_command_duration_seconds Duração dos comandos MongoDB por coleção e operação",
+                "# TYPE mongodb_command_duration_seconds histogram"
+            ]
+            for (colecao, comando), histograma in sorted(self._comandos.items()):
+                linhas += histograma.linhas("mongodb_command_duration_seconds",
+                                            _etiquetas(collection=colecao, command=comando))
+
+            linhas += [
+                "# HELP mongodb_command_failures_total Comandos MongoDB falhados por coleção e operação",
+                "# TYPE mongodb_command_failures_total counter"
+            ]
+            for (colecao, comando), falhas in sorted(self._falhas.items()):
+                linhas.append(f"mongodb_command_failures_total{{{_etiquetas(collection=colecao, command=comando)}}} {falhas}")
+        return "\n".join(linhas) + "\n"
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """
+    CommandListener do pymongo: regista cada comando no MetricsRegistry e
+    soma-o ao pedido HTTP em curso (se houver).
+    """
+
+    def __init__(self, registo):
+        self.registo = registo
+        # O evento de fim não traz o comando: guarda a coleção do início
+        self._em_curso = {}
+
+    def started(self, event):
+        comando = event.command_name
+        colecao = event.command.get(comando)
+        if not isinstance(colecao, str):
+            colecao = ""
+        self._em_curso[(event.connection_id, event.request_id)] = colecao
+
+    def _termina(self, event, sucesso):
+        colecao = self._em_curso.pop((event.connection_id, event.request_id), "")
+        duracao = event.duration_micros / 1e6
+        self.registo.observa_comando(colecao, event.command_name, duracao, sucesso)
+        pedido = _pedido_atual.get()
+        if pedido is not None:
+            pedido.comandos += 1
+            pedido.tempo_mongo += duracao
+
+    def succeeded(self, event):
+        self._termina(event, True)
+
+    def failed(self, event):
+        self._termina(event, False)
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI que mede a latência de cada pedido HTTP, por rota
+    (o template, ex: /materiais/{id_material}, não o caminho concreto).
+
+    É ASGI puro (sem BaseHTTPMiddleware), pelo que não copia o corpo das
+    respostas e funciona com respostas em streaming.
+    """
+
+    def __init__(self, app, registo, ignorar=("/metrics",)):
+        self.app = app
+        self.registo = registo
+        self.ignorar = set(ignorar)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.ignorar:
+            await self.app(scope, receive, send)
+            return
+
+        pedido = _Pedido()
+        token = _pedido_atual.set(pedido)
+        status = 500
+        inicio = time.perf_counter()
+
+        async def send_com_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_com_status)
+        finally:
+            duracao = time.perf_counter() - inicio
+            _pedido_atual.reset(token)
+            rota = scope.get("route")
+            rota = getattr(rota, "path", None) or "(sem rota)"
+            self.registo.observa_pedido(scope["method"], rota, status, duracao, pedido)
+
+
+# Pilha onde o SamplingProfiler conta as amostras de pilhas novas quando já guarda o máximo
+PILHA_OUTRAS = "(outras pilhas)"
+
+
+class SamplingProfiler:
+    """
+    Profiler por amostragem que pode ser ligado e desligado em execução.
+
+    Uma thread lê as pilhas de todas as threads (sys._current_frames) a cada
+    `intervalo` segundos e conta-as no formato "collapsed" (uma linha
+    "f1;f2;f3 N" por pilha, lido por flamegraph.pl/speedscope). Desligado não
+    tem custo; ligado, o custo é proporcional à frequência de amostragem.
+
+    Cada função é identificada pelo nome, ficheiro e primeira linha (não pela
+    linha em execução), e no máximo `maximo_pilhas` pilhas distintas são
+    guardadas: as amostras de pilhas novas para além desse número contam em
+    PILHA_OUTRAS, para a memória não crescer com o tempo ligado.
+    """
+
+    def __init__(self, intervalo=0.01, profundidade=64, maximo_pilhas=10000):
+        self.intervalo = intervalo
+        self.profundidade = profundidade
+        self.maximo_pilhas = maximo_pilhas
+        self._pilhas = Counter()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._parar = threading.Event()
+        self.amostras = 0
+
+    @property
+    def ativo(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def inicia(self, intervalo=None):
+        if intervalo:
+            self.intervalo = intervalo
+        if self.ativo:
+            return
+        self._parar.clear()
+        self._thread = threading.Thread(target=self._amostra, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def para(self):
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._thread = None
+
+    def limpa(self):
+        with self._lock:
+            self._pilhas.clear()
+            self.amostras = 0
+
+    def _amostra(self):
+        propria = threading.get_ident()
+        while not self._parar.wait(self.intervalo):
+            pilhas = []
+            for ident, frame in sys._current_frames().items():
+                if ident == propria:
+                    continue
+                funcoes = []
+                while frame is not None and len(funcoes) < self.profundidade:
+                    codigo = frame.f_code
+                    funcoes.append(f"{codigo.co_name} ({codigo.co_filename}:{codigo.co_firstlineno})")
+                    frame = frame.f_back
+                pilhas.append(";".join(reversed(funcoes)))
+            with self._lock:
+                for pilha in pilhas:
+                    if pilha not in self._pilhas and len(self._pilhas) >= self.maximo_pilhas:
+                        pilha = PILHA_OUTRAS
+                    self._pilhas[pilha] += 1
+                self.amostras += 1
+
+    def collapsed(self, limite=None, limpa=False):
+        """Pilhas mais frequentes no formato collapsed; com `limpa` as contagens recomeçam do zero"""
+        with self._lock:
+            texto = "\n".join(f"{pilha} {contagem}" for pilha, contagem in self._pilhas.most_common(limite)) + "\n"
+            if limpa:
+                self._pilhas.clear()
+                self.amostras = 0
+            return texto
+
+    def estado(self):
+        with self._lock:
+            return {
+                "ativo": self.ativo,
+                "intervalo": self.intervalo,
+                "amostras": self.amostras,
+                "pilhas_distintas": len(self._pilhas)
+            }
+
+
+# Instâncias usadas pela API
+registo = MetricsRegistry()
+listener = MongoCommandListener(registo)
+profiler = SamplingProfiler()
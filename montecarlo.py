@@ -0,0 +1,399 @@
+import argparse
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+import numpy as np
+
+from data_processing import (
+    ANNUAL_DEMAND,
+    HOLDING_COST,
+    INITIAL_STOCK,
+    LEAD_TIME,
+    MATERIAL_PRICES,
+    ORDER_COST,
+    SAFETY_STOCK,
+    calculate_economic_order_quantity,
+    calculate_reorder_point
+)
+from demand_stats import DemandStatistics
+from ingest import ingest_files
+from order_parser import find_order_files
+from simulation import PeriodicReviewPolicy, SQPolicy, SSPolicy
+
+
+# Políticas de reposição avaliáveis (classes do simulation)
+POLICIES = ("sq", "ss", "periodic")
+
+
+@dataclass(frozen=True)
+class Scenario:
+    """
+    One material under one reorder policy, with stochastic demand and lead time.
+
+    `policy` picks the simulation policy: "sq" is (s, Q) with `reorder_point`
+    and `order_quantity`, "ss" is (s, S) with `reorder_point` and
+    `order_up_to`, "periodic" orders up to `order_up_to` every
+    `review_period` days (only at or below `reorder_point`, when given).
+
+    Daily demand is drawn from a gamma distribution with the given mean and
+    coefficient of variation (Poisson when demand_cv is None); lead times are
+    integers drawn uniformly from [lead_time_min, lead_time_max].
+    """
+    material: str
+    reorder_point: Optional[float]
+    order_quantity: Optional[float] = None
+    policy: str = "sq"
+    order_up_to: Optional[float] = None
+    review_period: Optional[int] = None
+    mean_daily_demand: float = ANNUAL_DEMAND / 365
+    demand_cv: float = 0.3
+    lead_time_min: int = LEAD_TIME
+    lead_time_max: int = LEAD_TIME
+    initial_stock: float = INITIAL_STOCK
+    horizon: int = 365
+    order_cost: float = ORDER_COST
+    holding_cost: float = HOLDING_COST
+
+    def build_policy(self):
+        """The simulation.ReorderPolicy described by this scenario"""
+        if self.policy == "sq":
+            if self.reorder_point is None or self.order_quantity is None:
+                raise ValueError("(s, Q) needs reorder_point and order_quantity")
+            return SQPolicy(self.reorder_point, self.order_quantity)
+        if self.policy == "ss":
+            if self.reorder_point is None or self.order_up_to is None:
+                raise ValueError("(s, S) needs reorder_point and order_up_to")
+            return SSPolicy(self.reorder_point, self.order_up_to)
+        if self.policy == "periodic":
+            if self.review_period is None or self.order_up_to is None:
+                raise ValueError("periodic review needs review_period and order_up_to")
+            return PeriodicReviewPolicy(self.review_period, self.order_up_to, self.reorder_point)
+        raise ValueError(f"Unknown policy: {self.policy}")
+
+
+def _sample_demand(scenario, rng, replications):
+    shape = (replications, scenario.horizon)
+    mean = scenario.mean_daily_demand
+    if scenario.demand_cv is None:
+        return rng.poisson(mean, shape).astype(np.float64)
+    if scenario.demand_cv <= 0:
+        return np.full(shape, mean, dtype=np.float64)
+    k = 1.0 / scenario.demand_cv ** 2
+    return rng.gamma(k, mean / k, shape)
+
+
+def simulate_paths(scenario, demand, lead_times):
+    """
+    Steps every replication of a scenario through its policy at once.
+
+    `demand` and `lead_times` are (replications, horizon) arrays (the lead
+    time of an order placed on each day). Days are walked in a Python loop
+    but each day is a handful of numpy operations over the whole replication
+    axis, with the policy deciding through `order_quantities`. Day order and
+    costs are those of simulation.StockSimulator with lost sales: deliveries
+    arrive first, then demand is served and continuous-review policies are
+    asked (only on days with demand), periodic reviews happen at the end of
+    the day and holding cost is charged on the end-of-day stock.
+
+    Returns per-replication arrays (demand, unmet, stockout_days,
+    holding_cost, orders, order_cost, final_stock).
+    """
+    policy = scenario.build_policy()
+    replications, horizon = demand.shape
+    review_period = policy.review_period
+    first_review = getattr(policy, "first_review", 0)
+    daily_holding = scenario.holding_cost / 365.0
+    same_day = lead_times.min(initial=1) <= 0
+
+    on_hand = np.full(replications, float(scenario.initial_stock))
+    on_order = np.zeros(replications)
+    # Entregas por dia de chegada (as que chegam depois do horizonte ficam por receber)
+    arrivals = np.zeros((replications, horizon + int(lead_times.max(initial=0)) + 1))
+    unmet = np.zeros(replications)
+    stockout_days = np.zeros(replications)
+    holding = np.zeros(replications)
+    orders = np.zeros(replications)
+
+    for day in range(horizon):
+        received = arrivals[:, day].copy()
+        on_hand += received
+        on_order = np.maximum(on_order - received, 0.0)
+
+        today = demand[:, day]
+        served = np.minimum(today, np.maximum(on_hand, 0.0))
+        short = today - served
+        unmet += short
+        stockout_days += short > 0
+        on_hand -= served
+
+        if review_period:
+            ask = day >= first_review and (day - first_review) % review_period == 0
+        else:
+            ask = today > 0
+        if np.any(ask):
+            quantities = policy.order_quantities(on_hand + on_order, day)
+            placed = np.flatnonzero((quantities > 0) & ask)
+            if placed.size:
+                quantities = quantities[placed]
+                arrivals[placed, day + lead_times[placed, day]] += quantities
+                on_order[placed] += quantities
+                orders[placed] += 1
+                if same_day:
+                    # Prazo de 0 dias: a entrega chega ainda hoje, depois da procura
+                    late = arrivals[:, day] - received
+                    on_hand += late
+                    on_order = np.maximum(on_order - late, 0.0)
+
+        holding += np.maximum(on_hand, 0.0) * daily_holding
+
+    return {
+        "demand": demand.sum(axis=1),
+        "unmet": unmet,
+        "stockout_days": stockout_days,
+        "holding_cost": holding,
+        "orders": orders,
+        "order_cost": orders * scenario.order_cost,
+        "final_stock": on_hand
+    }
+
+
+def simulate_batch(scenario, replications, seed):
+    """
+    Runs `replications` independent replications of a scenario at once.
+
+    Demand and lead times are sampled with numpy for the whole batch and the
+    batch is stepped by simulate_paths, vectorized over the replications.
+    Returns per-batch sums so batches from different workers can be merged.
+    """
+    rng = np.random.default_rng(seed)
+    demand = _sample_demand(scenario, rng, replications)
+    lead_times = rng.integers(scenario.lead_time_min, scenario.lead_time_max + 1, (replications, scenario.horizon))
+    paths = simulate_paths(scenario, demand, lead_times)
+
+    return {
+        "replications": replications,
+        "stockouts": int(np.count_nonzero(paths["stockout_days"])),
+        "stockout_days": float(paths["stockout_days"].sum()),
+        "demand": float(paths["demand"].sum()),
+        "unmet": float(paths["unmet"].sum()),
+        "holding_cost": float(paths["holding_cost"].sum()),
+        "order_cost": float(paths["order_cost"].sum()),
+        "orders": float(paths["orders"].sum())
+    }
+
+
+def _run_task(task):
+    index, scenario, replications, seed = task
+    return index, simulate_batch(scenario, replications, seed)
+
+
+def summarize(scenario, totals):
+    """Turns merged batch sums into per-replication averages"""
+    n = totals["replications"]
+    return {
+        **asdict(scenario),
+        "replications": n,
+        "stockout_probability": totals["stockouts"] / n,
+        "mean_stockout_days": totals["stockout_days"] / n,
+        "fill_rate": 1 - totals["unmet"] / totals["demand"] if totals["demand"] else 1.0,
+        "mean_holding_cost": totals["holding_cost"] / n,
+        "mean_order_cost": totals["order_cost"] / n,
+        "mean_total_cost": (totals["holding_cost"] + totals["order_cost"]) / n,
+        "mean_orders": totals["orders"] / n
+    }
+
+
+def run_scenarios(scenarios, replications=1000, batch_size=250, workers=None, seed=0):
+    """
+    Evaluates many scenarios across a process pool.
+
+    Each scenario's replications are split into batches of `batch_size`;
+    every batch gets an independent random stream spawned from `seed`, so
+    results do not depend on the number of workers.
+    """
+    if replications < 1:
+        raise ValueError("replications must be at least 1")
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+    if workers is not None and workers < 1:
+        raise ValueError("workers must be at least 1 (None for one per CPU)")
+    scenarios = list(scenarios)
+    seeds = np.random.SeedSequence(seed).spawn(len(scenarios))
+    tasks = []
+    for index, (scenario, scenario_seed) in enumerate(zip(scenarios, seeds)):
+        n_batches = -(-replications // batch_size)
+        for b, batch_seed in enumerate(scenario_seed.spawn(n_batches)):
+            size = min(batch_size, replications - b * batch_size)
+            tasks.append((index, scenario, size, batch_seed))
+
+    # Somas por posição na lista: cenários repetidos são avaliados em separado
+    totals = {}
+    if workers == 1:
+        outputs = map(_run_task, tasks)
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        outputs = executor.map(_run_task, tasks, chunksize=max(1, len(tasks) // (4 * (workers or os.cpu_count()))))
+    try:
+        for index, batch in outputs:
+            merged = totals.setdefault(index, dict.fromkeys(batch, 0))
+            for key, value in batch.items():
+                merged[key] += value
+    finally:
+        if workers != 1:
+            executor.shutdown()
+
+    return [summarize(scenario, totals[index]) for index, scenario in enumerate(scenarios)]
+
+
+def material_profiles(file_names, **statistics_options):
+    """
+    Per-material scenario parameters observed in order files.
+
+    Daily consumption comes from ingest (one day per line, as in
+    data_processing.main) and goes through a DemandStatistics covering all
+    the days, which gives each material its mean daily demand, coefficient
+    of variation, price-scaled holding cost, reorder point (s) and EOQ (Q).
+    The order cost has no per-material data and stays global.
+    """
+    results = ingest_files(list(file_names), workers=1)
+    materials = results[0]["materials"] if results else list(MATERIAL_PRICES)
+    days = [usage for result in results for usage in result["day_usage"]]
+    stats = DemandStatistics(materials, window=max(len(days), 1), min_days=1, **statistics_options)
+    for usage in days:
+        stats.update_day(dict(zip(materials, usage.tolist())))
+
+    profiles = {}
+    for material in materials:
+        mean = stats.mean(material)
+        profiles[material] = {
+            "mean_daily_demand": mean,
+            "demand_cv": stats.std(material) / mean if mean > 0 else 0.0,
+            "holding_cost": stats.holding_costs[material],
+            "reorder_point": stats.reorder_point(material),
+            "order_quantity": stats.economic_order_quantity(material)
+        }
+    return profiles
+
+
+def sweep(materials, reorder_points=(None,), order_quantities=(None,), order_up_to=(None,), review_periods=(None,),
+          policy="sq", profiles=None, **scenario_options):
+    """
+    Scenarios for every (material, s, Q, S, R) combination of a parameter grid.
+
+    With `profiles` (from material_profiles) each material gets its own
+    demand, demand variability and holding cost. Grid values left as None
+    take the material's reorder point for s, its EOQ for Q, s + EOQ for S
+    and LEAD_TIME for R (the global constants for materials without a
+    profile); periodic review keeps s = None unless given. Only the
+    parameters of the chosen policy are set, and `scenario_options`
+    override the profile.
+    """
+    scenarios = []
+    for material in materials:
+        profile = dict((profiles or {}).get(material) or {})
+        default_s = profile.pop("reorder_point", calculate_reorder_point())
+        default_q = profile.pop("order_quantity", calculate_economic_order_quantity())
+        options = {**profile, **scenario_options}
+        for s, q, big_s, r in itertools.product(reorder_points, order_quantities, order_up_to, review_periods):
+            if s is None and policy != "periodic":
+                s = default_s
+            q = (default_q if q is None else q) if policy == "sq" else None
+            if policy == "sq":
+                big_s = None
+            elif big_s is None:
+                big_s = (default_s if s is None else s) + default_q
+            r = (LEAD_TIME if r is None else r) if policy == "periodic" else None
+            scenarios.append(Scenario(material, s, q, policy, big_s, r, **options))
+    return scenarios
+
+
+def _parse_values(text, kind=float):
+    return [kind(value) for value in text.split(",") if value]
+
+
+def _describe(result):
+    parameters = (("s", "reorder_point"), ("Q", "order_quantity"), ("S", "order_up_to"), ("R", "review_period"))
+    return " ".join(
+        f"{name}={result[key]:>9.1f}" for name, key in parameters if result[key] is not None
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Monte Carlo evaluation of reorder policies")
+    parser.add_argument("--policy", choices=POLICIES, default="sq",
+                        help="(s, Q), (s, S) or periodic review (R, S) / (R, s, S)")
+    parser.add_argument("--orders", default=".",
+                        help="Directory with order files or a glob; per-material demand and costs are taken from them")
+    parser.add_argument("--pattern", default="encomenda*.txt", help="File pattern used when --orders is a directory")
+    parser.add_argument("--materials", default=",".join(MATERIAL_PRICES), help="Comma-separated materials")
+    parser.add_argument("--reorder-points", default="",
+                        help="Comma-separated reorder points (s) to evaluate "
+                             "(default: per material; none for periodic review)")
+    parser.add_argument("--order-quantities", default="",
+                        help="Comma-separated order quantities (Q) to evaluate, for (s, Q) (default: per-material EOQ)")
+    parser.add_argument("--order-up-to", default="",
+                        help="Comma-separated order-up-to levels (S) to evaluate, for (s, S) and periodic review "
+                             "(default: s + EOQ per material)")
+    parser.add_argument("--review-periods", default=str(LEAD_TIME),
+                        help="Comma-separated review periods (R) in days, for periodic review")
+    parser.add_argument("--daily-demand", type=float, default=None,
+                        help="Mean daily demand for every material (overrides the order files)")
+    parser.add_argument("--demand-cv", type=float, default=None,
+                        help="Demand coefficient of variation for every material (<0 for Poisson; "
+                             "overrides the order files)")
+    parser.add_argument("--lead-time-min", type=int, default=LEAD_TIME - 2)
+    parser.add_argument("--lead-time-max", type=int, default=LEAD_TIME + 2)
+    parser.add_argument("--initial-stock", type=float, default=INITIAL_STOCK + SAFETY_STOCK)
+    parser.add_argument("--horizon", type=int, default=365)
+    parser.add_argument("--replications", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=250)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    file_names = find_order_files(args.orders, args.pattern)
+    profiles = material_profiles(file_names) if file_names else None
+    if profiles is None:
+        print(f"No order files found in {args.orders}; using the global constants for every material")
+
+    options = {}
+    if args.daily_demand is not None:
+        options["mean_daily_demand"] = args.daily_demand
+    if args.demand_cv is not None:
+        options["demand_cv"] = None if args.demand_cv < 0 else args.demand_cv
+    try:
+        scenarios = sweep(
+            [m for m in args.materials.split(",") if m],
+            _parse_values(args.reorder_points) or [None],
+            _parse_values(args.order_quantities) or [None],
+            _parse_values(args.order_up_to) or [None],
+            _parse_values(args.review_periods, int) or [None],
+            args.policy,
+            profiles,
+            lead_time_min=args.lead_time_min,
+            lead_time_max=args.lead_time_max,
+            initial_stock=args.initial_stock,
+            horizon=args.horizon,
+            **options
+        )
+        results = run_scenarios(scenarios, args.replications, args.batch_size, args.workers, args.seed)
+    except ValueError as error:
+        parser.error(str(error))
+
+    for r in results:
+        print(f"{r['material']:<10} {_describe(r)}  "
+              f"P(stockout)={r['stockout_probability']:.3f}  fill={r['fill_rate']:.4f}  "
+              f"holding={r['mean_holding_cost']:.2f}  ordering={r['mean_order_cost']:.2f}")
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
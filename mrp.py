@@ -0,0 +1,275 @@
+import math
+from datetime import date, timedelta
+
+import numpy as np
+
+from constants import LEAD_TIME
+from scheduler import parse_day
+
+DEFAULT_HORIZON = 365  # in days
+DEFAULT_LEAD_TIME = LEAD_TIME  # in days
+
+# Tolerância nas comparações de quantidades (arredondamentos das receitas)
+_EPSILON = 1e-9
+
+
+def _per_material(value, materials, default):
+    """Expands a scalar or a {material: value} dict into one value per material"""
+    if isinstance(value, dict):
+        return np.array([value.get(material, default) for material in materials], dtype=np.float64)
+    return np.full(len(materials), default if value is None else value, dtype=np.float64)
+
+
+class MRPResult:
+    """
+    Time-phased plan of a MRPEngine run: (materials, horizon) arrays with one
+    bucket per day, day 0 being `start_date`.
+    """
+
+    def __init__(self, engine, start_date, gross, receipts, projected, net, planned_receipts,
+                 planned_releases, late_releases, on_hand):
+        self.materials = engine.materials
+        self.horizon = engine.horizon
+        self.lead_time = engine.lead_time
+        self.start_date = start_date
+        self.gross = gross
+        self.receipts = receipts
+        self.projected = projected
+        self.net = net
+        self.planned_receipts = planned_receipts
+        self.planned_releases = planned_releases
+        self.late_releases = late_releases
+        self.on_hand = on_hand
+
+    def _date(self, day):
+        return (self.start_date + timedelta(days=int(day))).isoformat()
+
+    def planned_orders(self):
+        """
+        Planned supplier orders in release order: material, quantity, order
+        (release) date and due date. Orders that should have been released
+        before day 0 are released on day 0 and marked as late.
+        """
+        orders = []
+        materials, days = np.nonzero(self.planned_receipts > _EPSILON)
+        releases = days - self.lead_time[materials]
+        for release, m, due in sorted(zip(releases.tolist(), materials.tolist(), days.tolist())):
+            orders.append({
+                "id_material": self.materials[m],
+                "quantidade": float(self.planned_receipts[m, due]),
+                "data_encomenda": self._date(max(release, 0)),
+                "data_necessaria": self._date(due),
+                "atrasada": release < 0
+            })
+        return orders
+
+    def as_dict(self, detail=False):
+        """
+        Summary per material (totals, first shortage without planned orders,
+        minimum projected stock) and the planned orders; with `detail` the
+        daily buckets are included as lists.
+        """
+        materials = {}
+        for m, material in enumerate(self.materials):
+            without_orders = self.on_hand[m] + np.cumsum(self.receipts[m] - self.gross[m])
+            shortage = np.flatnonzero(without_orders < -_EPSILON)
+            entry = {
+                "estoque_inicial": float(self.on_hand[m]),
+                "necessidades_brutas": float(self.gross[m].sum()),
+                "entregas_previstas": float(self.receipts[m].sum()),
+                "necessidades_liquidas": float(self.net[m].sum()),
+                "encomendas_planeadas": float(self.planned_receipts[m].sum()),
+                "prazo_fornecedor_dias": int(self.lead_time[m]),
+                "primeira_rutura": self._date(shortage[0]) if shortage.size else None,
+                "estoque_minimo_projetado": float(self.projected[m].min()) if self.horizon else float(self.on_hand[m])
+            }
+            if detail:
+                entry["diario"] = {
+                    "necessidades_brutas": self.gross[m].tolist(),
+                    "entregas_previstas": self.receipts[m].tolist(),
+                    "estoque_projetado": self.projected[m].tolist(),
+                    "necessidades_liquidas": self.net[m].tolist(),
+                    "rececoes_planeadas": self.planned_receipts[m].tolist(),
+                    "lancamentos_planeados": self.planned_releases[m].tolist()
+                }
+            materials[material] = entry
+        return {
+            "inicio": self.start_date.isoformat(),
+            "horizonte": self.horizon,
+            "materiais": materials,
+            "encomendas_planeadas": self.planned_orders()
+        }
+
+
+class MRPEngine:
+    """
+    Material requirements planning over daily buckets.
+
+    Gross requirements and scheduled receipts are (materials, horizon)
+    arrays. Netting runs on whole arrays: the projected stock without new
+    orders is the on-hand stock plus the cumulative receipts minus
+    requirements, and with lot-for-lot sizing the cumulative planned
+    receipts are the running maximum of the shortfall below safety stock, so
+    a 365-day plan for every material is a handful of numpy passes. Materials
+    with a lot multiple or a minimum order quantity are sized in a loop over
+    their shortage days only.
+
+    Planned receipts are offset by each material's lead time to give the
+    planned order releases; releases that would fall before day 0 are
+    released on day 0 and flagged late.
+
+    `lead_time`, `safety_stock`, `lot_size` (order in multiples of) and
+    `min_order` take a scalar for every material or a {material: value} dict.
+    """
+
+    def __init__(self, materials, horizon=DEFAULT_HORIZON, lead_time=DEFAULT_LEAD_TIME, safety_stock=0.0,
+                 lot_size=None, min_order=None):
+        if horizon < 0:
+            raise ValueError("horizon must not be negative")
+        self.materials = list(materials)
+        self.horizon = horizon
+        self._material_index = {material: m for m, material in enumerate(self.materials)}
+        self.lead_time = _per_material(lead_time, self.materials, DEFAULT_LEAD_TIME).astype(np.int64)
+        self.safety_stock = _per_material(safety_stock, self.materials, 0.0)
+        self.lot_size = _per_material(lot_size, self.materials, 0.0)
+        self.min_order = _per_material(min_order, self.materials, 0.0)
+
+    def empty_buckets(self):
+        return np.zeros((len(self.materials), self.horizon))
+
+    def bucket(self, days, quantities, buckets=None):
+        """
+        Adds an (N, materials) array of quantities into daily buckets by day.
+        Past days go into day 0; days beyond the horizon are dropped.
+        Returns the buckets and the total dropped per material.
+        """
+        buckets = self.empty_buckets() if buckets is None else buckets
+        days = np.maximum(np.asarray(days, dtype=np.int64), 0)
+        quantities = np.asarray(quantities, dtype=np.float64).reshape(len(days), len(self.materials))
+        inside = days < self.horizon
+        for m in range(len(self.materials)):
+            buckets[m] += np.bincount(days[inside], weights=quantities[inside, m], minlength=self.horizon)
+        return buckets, quantities[~inside].sum(axis=0)
+
+    def bucket_by_material(self, entries, buckets=None):
+        """Same as bucket() for (day, material, quantity) tuples; unknown materials are ignored"""
+        rows = [(day, self._material_index[material], quantity)
+                for day, material, quantity in entries if material in self._material_index]
+        quantities = np.zeros((len(rows), len(self.materials)))
+        for i, (_, m, quantity) in enumerate(rows):
+            quantities[i, m] = quantity
+        return self.bucket([day for day, _, _ in rows], quantities, buckets)
+
+    def _lot_sized(self, shortfall, m):
+        # Encomendas em múltiplos de lot_size e nunca abaixo de min_order
+        planned = np.zeros(self.horizon)
+        covered = 0.0
+        lot = self.lot_size[m]
+        minimum = self.min_order[m]
+        for day in np.flatnonzero(shortfall > _EPSILON):
+            missing = shortfall[day] - covered
+            if missing <= _EPSILON:
+                continue
+            quantity = max(missing, minimum)
+            if lot > 0:
+                quantity = math.ceil(quantity / lot - _EPSILON) * lot
+            planned[day] = quantity
+            covered += quantity
+        return planned
+
+    def run(self, gross, receipts, on_hand, start_date=None):
+        """
+        Nets `gross` requirements against `on_hand` stock ({material: qty}
+        or an array) and scheduled `receipts`. Returns a MRPResult.
+        """
+        gross = np.asarray(gross, dtype=np.float64)
+        receipts = np.asarray(receipts, dtype=np.float64)
+        if not isinstance(on_hand, np.ndarray):
+            on_hand = _per_material(on_hand, self.materials, 0.0)
+
+        # Estoque projetado sem novas encomendas e o que falta para o estoque de segurança
+        projected = on_hand[:, None] + np.cumsum(receipts - gross, axis=1)
+        shortfall = self.safety_stock[:, None] - projected
+
+        # Lote a lote: o acumulado das receções planeadas é o máximo corrido da falta
+        covered = np.maximum.accumulate(np.maximum(shortfall, 0.0), axis=1)
+        planned = np.diff(covered, axis=1, prepend=0.0)
+        for m in np.flatnonzero((self.lot_size > 0) | (self.min_order > 0)):
+            planned[m] = self._lot_sized(shortfall[m], m)
+        planned[planned < _EPSILON] = 0.0
+
+        cumulative_planned = np.cumsum(planned, axis=1)
+        net = np.maximum(shortfall - (cumulative_planned - planned), 0.0)
+        projected = projected + cumulative_planned
+
+        # Lançamentos: receções planeadas recuadas pelo prazo de entrega de cada material
+        releases = np.zeros_like(planned)
+        late = np.zeros(len(self.materials))
+        for m in range(len(self.materials)):
+            lead_time = int(self.lead_time[m])
+            if lead_time <= 0:
+                releases[m] = planned[m]
+                continue
+            releases[m, :max(self.horizon - lead_time, 0)] = planned[m, lead_time:]
+            late[m] = planned[m, :lead_time].sum()
+            releases[m, 0] += late[m]
+
+        return MRPResult(self, start_date or date.today(), gross, receipts, projected, net, planned,
+                         releases, late, on_hand)
+
+
+def plan_from_encomendas(encomendas, tipos_roupa, stock, deliveries, start_date=None, horizon=DEFAULT_HORIZON,
+                         production_offset=0, **engine_options):
+    """
+    Builds and runs the MRP for open encomendas: the materials of each item
+    (BOM from tipos_roupa) are required `production_offset` days before its
+    prazo_entrega; expected deliveries (not received) are the scheduled
+    receipts on their data_prevista.
+
+    Returns (result, skipped, beyond): `skipped` maps the id_encomenda of
+    encomendas with items left out (bad prazo_entrega, unknown type or size)
+    to the reason, `beyond` has the per-material totals past the horizon.
+    """
+    from bom import BOMTensor
+    start_date = start_date or date.today()
+    bom = BOMTensor.from_tipos_roupa(tipos_roupa)
+    engine = MRPEngine(bom.materials, horizon, **engine_options)
+
+    days, types, sizes, quantities = [], [], [], []
+    skipped = {}
+    for encomenda in encomendas:
+        try:
+            day = parse_day(encomenda.get("prazo_entrega"), start_date) - production_offset
+        except (ValueError, TypeError) as e:
+            skipped[encomenda.get("id_encomenda")] = str(e)
+            continue
+        for item in encomenda.get("itens") or []:
+            if item.get("id_tipo") not in bom.types or item.get("tamanho") not in bom.sizes:
+                skipped[encomenda.get("id_encomenda")] = \
+                    f"Tipo ou tamanho desconhecido: {item.get('id_tipo')} {item.get('tamanho')}"
+                continue
+            days.append(day)
+            types.append(item["id_tipo"])
+            sizes.append(item["tamanho"])
+            quantities.append(item.get("quantidade", 1))
+
+    requirements = bom.requirements(types, sizes, quantities) if days else np.zeros((0, len(bom.materials)))
+    gross, gross_beyond = engine.bucket(days, requirements)
+
+    entries = []
+    for delivery in deliveries:
+        if delivery.get("recebida"):
+            continue
+        try:
+            entries.append((parse_day(delivery["data_prevista"], start_date), delivery["id_material"],
+                            delivery["quantidade"]))
+        except (ValueError, TypeError, KeyError):
+            continue
+    receipts, receipts_beyond = engine.bucket_by_material(entries)
+
+    result = engine.run(gross, receipts, stock, start_date)
+    beyond = {
+        material: {"necessidades_brutas": float(g), "entregas_previstas": float(r)}
+        for material, g, r in zip(bom.materials, gross_beyond, receipts_beyond)
+    }
+    return result, skipped, beyond
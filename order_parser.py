@@ -0,0 +1,226 @@
+import codecs
+import glob
+import os
+import re
+from typing import NamedTuple
+
+# Formatos de ficheiro de encomenda suportados
+LINE_FORMAT = "line"        # "135 Camisola XL", uma encomenda por linha
+COMPACT_FORMAT = "compact"  # "145CamisolaXL130TshirtS...", tudo junto
+TEXT_FORMAT = "text"        # "... 145 Camisola do tamanho L ..."
+
+CHUNK_SIZE = 64 * 1024
+# Quantidade máxima de texto lida para detetar o formato de um ficheiro
+DETECT_LIMIT = 4096
+
+_LINE_ORDER = re.compile(r'^(\d+)\s+(\w+)\s+(\w+)$')
+_COMPACT_LINE = re.compile(r'^\d+\w+$')
+_COMPACT_ORDER = re.compile(r'(\d+)([A-Z][a-z]+)([A-Z]+)')
+# Prefixo de uma encomenda compacta que pode continuar no bloco seguinte
+_COMPACT_PARTIAL = re.compile(r'\d+(?:[A-Z][a-z]*[A-Z]*)?\Z')
+_TEXT_ORDER = re.compile(r'(\d+)\s+(\w+)\s+do tamanho\s+(\w+)')
+_NATURAL_KEY = re.compile(r'(\d+)')
+
+
+class OrderRecord(NamedTuple):
+    quantity: int
+    type: str
+    size: str
+    source: str
+    line_no: int
+
+    def as_dict(self):
+        """Returns the order in the dict shape used by data_processing"""
+        return {"Quantity": self.quantity, "Type": self.type, "Size": self.size}
+
+
+class UnparsedLine(NamedTuple):
+    source: str
+    line_no: int
+    text: str
+
+
+def detect_format(line):
+    """Detects the order file format from its first non-empty line"""
+    line = line.strip()
+    if _LINE_ORDER.match(line):
+        return LINE_FORMAT
+    if _COMPACT_LINE.match(line):
+        return COMPACT_FORMAT
+    return TEXT_FORMAT
+
+
+def _read_chunks(fileobj, chunk_size):
+    """Reads a text or binary file-like object as a stream of text chunks"""
+    decoder = None
+    while True:
+        chunk = fileobj.read(chunk_size)
+        if not chunk:
+            break
+        if isinstance(chunk, bytes):
+            if decoder is None:
+                decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            chunk = decoder.decode(chunk)
+        yield chunk
+    if decoder is not None:
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield tail
+
+
+def _split_lines(chunks):
+    """Yields (line_no, line) from a stream of chunks, holding at most one line"""
+    pending = []
+    line_no = 0
+    for chunk in chunks:
+        lines = chunk.split("\n")
+        if len(lines) == 1:
+            pending.append(chunk)
+            continue
+        pending.append(lines[0])
+        lines[0] = "".join(pending)
+        pending = [lines.pop()]
+        for line in lines:
+            line_no += 1
+            yield line_no, line
+    if "".join(pending):
+        yield line_no + 1, "".join(pending)
+
+
+def _parse_lines(lines, fmt, source, on_error):
+    pattern = _LINE_ORDER if fmt == LINE_FORMAT else _TEXT_ORDER
+    for line_no, line in lines:
+        line = line.strip()
+        if not line:
+            continue
+
+        if fmt == LINE_FORMAT:
+            match = pattern.match(line)
+            matches = [match] if match else []
+        else:
+            matches = pattern.finditer(line)
+
+        found = False
+        for match in matches:
+            found = True
+            yield OrderRecord(int(match.group(1)), match.group(2), match.group(3).upper(), source, line_no)
+        if not found and on_error is not None:
+            on_error(UnparsedLine(source, line_no, line))
+
+
+def _parse_compact(chunks, source, on_error):
+    """
+    Scans run-together orders chunk by chunk, so a single multi-GB line is
+    parsed without ever being held in memory.
+    """
+    buffer = ""
+    line_no = 1
+    # Texto não reconhecido, juntado até à próxima encomenda ou fim de linha
+    junk = []
+    junk_size = 0
+    junk_line = line_no
+
+    def flush_junk():
+        nonlocal junk_size
+        text = "".join(junk).strip()
+        if text and on_error is not None:
+            on_error(UnparsedLine(source, junk_line, text))
+        junk.clear()
+        junk_size = 0
+
+    def consume_gap(gap):
+        nonlocal line_no, junk_size, junk_line
+        for i, part in enumerate(gap.split("\n")):
+            if i:
+                flush_junk()
+                line_no += 1
+            if part.strip():
+                if not junk:
+                    junk_line = line_no
+                junk.append(part)
+                junk_size += len(part)
+        if junk_size > DETECT_LIMIT:
+            flush_junk()
+
+    chunks = iter(chunks)
+    eof = False
+    while not eof:
+        chunk = next(chunks, None)
+        if chunk is None:
+            eof = True
+        else:
+            buffer += chunk
+
+        pos = 0
+        for match in _COMPACT_ORDER.finditer(buffer):
+            # A encomenda pode continuar no próximo bloco
+            if match.end() == len(buffer) and not eof:
+                break
+            consume_gap(buffer[pos:match.start()])
+            flush_junk()
+            yield OrderRecord(int(match.group(1)), match.group(2), match.group(3).upper(), source, line_no)
+            pos = match.end()
+
+        tail = buffer[pos:]
+        partial = None if eof else _COMPACT_PARTIAL.search(tail)
+        keep_from = partial.start() if partial else len(tail)
+        consume_gap(tail[:keep_from])
+        buffer = tail[keep_from:]
+
+    flush_junk()
+
+
+def parse_stream(fileobj, source="<stream>", fmt=None, on_error=None, chunk_size=CHUNK_SIZE):
+    """
+    Parses orders lazily from a text or binary file-like object.
+
+    The format is detected once, from the first non-empty line, unless `fmt`
+    is given. Lines (or compact segments) that hold no order are passed to
+    `on_error` as UnparsedLine records.
+    """
+    chunks = _read_chunks(fileobj, chunk_size)
+    head = []
+    if fmt is None:
+        # Lê apenas até à primeira linha não vazia (ou um bloco, se for muito longa)
+        for chunk in chunks:
+            head.append(chunk)
+            text = "".join(head).lstrip()
+            if "\n" in text or len(text) >= DETECT_LIMIT:
+                break
+        text = "".join(head).lstrip()
+        fmt = detect_format(text.split("\n", 1)[0][:DETECT_LIMIT])
+
+    def all_chunks():
+        yield from head
+        yield from chunks
+
+    if fmt == COMPACT_FORMAT:
+        yield from _parse_compact(all_chunks(), source, on_error)
+    else:
+        yield from _parse_lines(_split_lines(all_chunks()), fmt, source, on_error)
+
+
+def parse_file(path, fmt=None, on_error=None, chunk_size=CHUNK_SIZE):
+    """Parses a single order file lazily"""
+    with open(path, "r", encoding="utf-8", errors="replace") as file:
+        yield from parse_stream(file, source=path, fmt=fmt, on_error=on_error, chunk_size=chunk_size)
+
+
+def natural_sort_key(path):
+    """Sort key that places encomenda2.txt before encomenda10.txt"""
+    return [int(part) if part.isdigit() else part for part in _NATURAL_KEY.split(path)]
+
+
+def find_order_files(path, pattern="encomenda*.txt"):
+    """Returns the order files in a directory (or matching a glob) in natural order"""
+    if os.path.isdir(path):
+        files = glob.glob(os.path.join(path, pattern))
+    else:
+        files = glob.glob(path)
+    return sorted((f for f in files if os.path.isfile(f)), key=natural_sort_key)
+
+
+def parse_directory(path, pattern="encomenda*.txt", on_error=None, chunk_size=CHUNK_SIZE):
+    """Parses every order file in a directory (or glob), one file at a time"""
+    for file_name in find_order_files(path, pattern):
+        yield from parse_file(file_name, on_error=on_error, chunk_size=chunk_size)
@@ -0,0 +1,271 @@
+import os
+import shutil
+import time
+import uuid
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+from pyarrow import fs
+
+from bom import BOMTensor
+
+ORDER_STORE_PATH = "./order_store"
+
+ORDERS_SCHEMA = pa.schema([
+    ("Day", pa.int32()),
+    ("Quantity", pa.int32()),
+    ("Type", pa.dictionary(pa.int32(), pa.string())),
+    ("Size", pa.dictionary(pa.int32(), pa.string())),
+    ("Source", pa.dictionary(pa.int32(), pa.string()))
+])
+
+# Colunas exportadas para o xlsx (formato do output.xlsx original)
+XLSX_COLUMNS = ["Day", "Quantity", "Type", "Size"]
+
+_PARTITIONING = ds.partitioning(pa.schema([("Day", pa.int32())]), flavor="hive")
+
+
+class OrderStore:
+    """
+    Columnar store for parsed orders and daily material usage.
+
+    Both datasets are Parquet, partitioned by day (`Day=<n>/` directories),
+    under `root/orders` and `root/usage`. Appends only add new files, so
+    writers never rewrite existing partitions; every append to the orders
+    also appends the material usage of those orders, computed with the BOM.
+    Both are first written to a staging directory under `root` and then
+    renamed into place, so a failed write publishes neither; only a crash
+    during the renames themselves can leave one dataset without the other.
+
+    Readers push filters (day range, types, sizes) down to the partition and
+    row-group level and only read the requested columns. Files are memory
+    mapped, so aggregation runs over the mapped columns without copying
+    them into Python objects.
+    """
+
+    def __init__(self, root=ORDER_STORE_PATH, bom=None):
+        self.root = root
+        self.bom = bom or BOMTensor.from_constants()
+        self.orders_path = os.path.join(root, "orders")
+        self.usage_path = os.path.join(root, "usage")
+        self.usage_schema = pa.schema(
+            [("Day", pa.int32())] + [(material, pa.float64()) for material in self.bom.materials]
+        )
+        self._filesystem = fs.LocalFileSystem(use_mmap=True)
+        self._datasets = {}
+
+    # Escrita
+
+    def append_orders(self, orders, day=None, source=None):
+        """
+        Appends orders and their daily material usage.
+
+        `orders` is a pandas DataFrame, Arrow table or dict of columns with
+        Day, Quantity, Type and Size (Source optional), or an iterable of
+        dicts / OrderRecords (with `day` for all of them, or a "Day" key per
+        dict). Returns the number of rows.
+        """
+        table = self._to_orders_table(orders, day, source)
+        if table.num_rows == 0:
+            return 0
+
+        days = table["Day"].to_numpy()
+        first_day = int(days.min())
+        usage = self._usage_of(table, days - first_day, int(days.max()) - first_day + 1)
+        used_days = np.flatnonzero(usage.any(axis=1))
+        usage_table = pa.table(
+            [pa.array(used_days + first_day, pa.int32())] + [pa.array(usage[used_days, m]) for m in range(usage.shape[1])],
+            schema=self.usage_schema
+        )
+
+        staging = self._staging_path()
+        try:
+            self._write(table, os.path.join(staging, "orders"))
+            self._write(usage_table, os.path.join(staging, "usage"))
+            self._publish(staging)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        return table.num_rows
+
+    def _to_orders_table(self, orders, day, source):
+        if isinstance(orders, pa.Table):
+            table = orders
+        elif isinstance(orders, dict):
+            table = pa.table(orders)
+        elif hasattr(orders, "to_dict"):
+            table = pa.Table.from_pandas(orders, preserve_index=False)
+        else:
+            rows = [
+                {**order.as_dict(), "Source": order.source} if hasattr(order, "as_dict") else dict(order)
+                for order in orders
+            ]
+            table = pa.Table.from_pylist(rows)
+
+        columns = {}
+        for field in ORDERS_SCHEMA:
+            if field.name in table.column_names:
+                columns[field.name] = table[field.name].cast(field.type)
+            elif field.name == "Day" and day is not None:
+                columns["Day"] = pa.array(np.full(table.num_rows, day, dtype=np.int32))
+            elif field.name == "Source":
+                columns["Source"] = pa.array([source] * table.num_rows, pa.string()).dictionary_encode()
+            else:
+                raise ValueError(f"Missing column: {field.name}")
+        return pa.table(columns, schema=ORDERS_SCHEMA)
+
+    def _write(self, table, path):
+        # Nomes ordenáveis pelo instante da escrita: a leitura devolve as linhas pela ordem de inserção
+        basename = f"part-{time.time_ns():020d}-{uuid.uuid4().hex[:8]}-{{i}}.parquet"
+        # Linhas agrupadas por dia: cada partição recebe blocos contíguos em vez de milhares de row groups
+        table = table.take(pc.sort_indices(table, [("Day", "ascending")]))
+        ds.write_dataset(
+            table, path, format="parquet", partitioning=_PARTITIONING, basename_template=basename,
+            existing_data_behavior="overwrite_or_ignore", filesystem=self._filesystem
+        )
+
+    def _staging_path(self):
+        # Dentro de root para os os.replace de _publish não mudarem de sistema de ficheiros
+        return os.path.join(self.root, f"_staging-{uuid.uuid4().hex}")
+
+    def _publish(self, staging):
+        """Moves every file written under `staging` to the same relative path under root"""
+        moves = []
+        for directory, _, file_names in os.walk(staging):
+            target = os.path.join(self.root, os.path.relpath(directory, staging))
+            moves += [(os.path.join(directory, name), os.path.join(target, name)) for name in file_names]
+        for source, target in moves:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(source, target)
+        self._datasets.clear()
+
+    def import_xlsx(self, path):
+        """Loads an exported (or legacy output.xlsx) spreadsheet into the store"""
+        import pandas as pd
+        return self.append_orders(pd.read_excel(path, usecols=XLSX_COLUMNS))
+
+    # Leitura
+
+    def _dataset(self, path):
+        dataset = self._datasets.get(path)
+        if dataset is None:
+            schema = ORDERS_SCHEMA if path == self.orders_path else self.usage_schema
+            if not os.path.isdir(path):
+                return None
+            dataset = ds.dataset(path, schema=schema, format="parquet", partitioning=_PARTITIONING,
+                                 filesystem=self._filesystem)
+            self._datasets[path] = dataset
+        return dataset
+
+    def is_empty(self):
+        return self._dataset(self.orders_path) is None
+
+    @staticmethod
+    def filter_expression(days=None, types=None, sizes=None):
+        """
+        Builds the pushed-down filter: `days` is a (first, last) inclusive
+        range (either end may be None) or a list of days.
+        """
+        expression = None
+
+        def add(condition):
+            nonlocal expression
+            expression = condition if expression is None else expression & condition
+
+        if days is not None:
+            if isinstance(days, tuple):
+                first, last = days
+                if first is not None:
+                    add(ds.field("Day") >= first)
+                if last is not None:
+                    add(ds.field("Day") <= last)
+            else:
+                add(ds.field("Day").isin(list(days)))
+        if types is not None:
+            add(ds.field("Type").isin(list(types)))
+        if sizes is not None:
+            add(ds.field("Size").isin(list(sizes)))
+        return expression
+
+    def orders(self, columns=None, days=None, types=None, sizes=None):
+        """Arrow table with the requested columns of the matching orders, in day order"""
+        dataset = self._dataset(self.orders_path)
+        if dataset is None:
+            schema = ORDERS_SCHEMA if columns is None else pa.schema([ORDERS_SCHEMA.field(c) for c in columns])
+            return schema.empty_table()
+        table = dataset.to_table(columns=columns, filter=self.filter_expression(days, types, sizes))
+        if "Day" in table.column_names:
+            # Partições são lidas em paralelo; a ordenação é estável dentro de cada dia
+            table = table.take(pc.sort_indices(table, [("Day", "ascending")]))
+        return table
+
+    def daily_usage(self, days=None, materials=None):
+        """
+        Material usage per day for the matching days, as (days, usage) where
+        usage is a (len(days), len(materials)) array.
+        """
+        materials = list(materials or self.bom.materials)
+        dataset = self._dataset(self.usage_path)
+        if dataset is None:
+            return np.empty(0, dtype=np.int32), np.empty((0, len(materials)))
+        table = dataset.to_table(columns=["Day"] + materials, filter=self.filter_expression(days))
+        grouped = table.group_by("Day").aggregate([(material, "sum") for material in materials])
+        grouped = grouped.sort_by("Day")
+        usage = np.column_stack([grouped[f"{material}_sum"].to_numpy() for material in materials]) \
+            if grouped.num_rows else np.empty((0, len(materials)))
+        return grouped["Day"].to_numpy(), usage
+
+    def material_totals(self, days=None, types=None, sizes=None):
+        """Total material requirements of the matching orders, as {material: amount}"""
+        if types is None and sizes is None:
+            _, usage = self.daily_usage(days)
+            totals = usage.sum(axis=0)
+        else:
+            table = self.orders(["Quantity", "Type", "Size"], days, types, sizes)
+            totals = self._usage_of(table)
+        return dict(zip(self.bom.materials, totals.tolist()))
+
+    def _usage_of(self, table, groups=None, n_groups=None):
+        if table.num_rows == 0:
+            return np.zeros((n_groups or 0, len(self.bom.materials))) if groups is not None \
+                else np.zeros(len(self.bom.materials))
+        # Ficheiros diferentes têm dicionários diferentes: unifica antes de juntar os blocos
+        table = table.unify_dictionaries()
+        types = table["Type"].combine_chunks()
+        sizes = table["Size"].combine_chunks()
+        return self.bom.totals_from_codes(
+            types.indices.to_numpy(zero_copy_only=False), types.dictionary.to_pylist(),
+            sizes.indices.to_numpy(zero_copy_only=False), sizes.dictionary.to_pylist(),
+            table["Quantity"].to_numpy(), groups, n_groups
+        )
+
+    # Exportação
+
+    def export_xlsx(self, path, days=None, types=None, sizes=None):
+        """Writes the matching orders as a spreadsheet with the output.xlsx columns"""
+        self.orders(XLSX_COLUMNS, days, types, sizes).to_pandas().to_excel(path, index=False)
+        return path
+
+    def compact(self):
+        """Rewrites each day partition as a single file (after many small appends)"""
+        for path in (self.orders_path, self.usage_path):
+            dataset = self._dataset(path)
+            if dataset is None:
+                continue
+            old_files = list(dataset.files)
+            table = dataset.to_table()
+            if "Quantity" in table.column_names:
+                table = table.take(pc.sort_indices(table, [("Day", "ascending")]))
+            else:
+                grouped = table.group_by("Day").aggregate([(m, "sum") for m in self.bom.materials])
+                table = pa.table({"Day": grouped["Day"], **{m: grouped[f"{m}_sum"] for m in self.bom.materials}})
+            staging = self._staging_path()
+            try:
+                self._write(table.cast(dataset.schema), os.path.join(staging, os.path.relpath(path, self.root)))
+                self._publish(staging)
+            finally:
+                shutil.rmtree(staging, ignore_errors=True)
+            for file_name in old_files:
+                os.remove(file_name)
+            self._datasets.pop(path, None)
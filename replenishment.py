@@ -0,0 +1,112 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from data_processing import MATERIAL_PRICES
+
+# Nomes usados nas notas de encomenda (supply_processing.MATERIAL_PRICES)
+PDF_MATERIAL_NAMES = {
+    "tecido": "fabric",
+    "algodao": "cotton",
+    "fio": "thread",
+    "poliester": "polyester"
+}
+
+DEFAULT_SUPPLIER = "SciTeCh24"
+DEFAULT_WINDOW = 3  # in days
+
+
+class ReplenishmentPipeline:
+    """
+    Coalesces reorder triggers into one supplier order per supplier.
+
+    The first trigger for a supplier opens a batch; every trigger for the
+    same supplier within `window` days is added to it (quantities of the same
+    material are summed). Once the window has passed the batch becomes a
+    supplier order, costed with MATERIAL_PRICES, and its note is generated in
+    the background, so a burst of reorders produces a single document.
+
+    `suppliers` maps material -> supplier; unmapped materials go to
+    `default_supplier`. With `output_dir=None` notes are kept as bytes.
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW, suppliers=None, default_supplier=DEFAULT_SUPPLIER,
+                 output_dir=None, generate_pdfs=True, executor=None):
+        self.window = window
+        self.suppliers = dict(suppliers or {})
+        self.default_supplier = default_supplier
+        self.output_dir = output_dir
+        self.generate_pdfs = generate_pdfs
+        self.orders = []
+        self._batches = {}
+        self._futures = []
+        self._own_executor = executor is None and generate_pdfs
+        self._executor = ThreadPoolExecutor(max_workers=1) if self._own_executor else executor
+
+    def supplier_for(self, material):
+        return self.suppliers.get(material, self.default_supplier)
+
+    def trigger(self, day, material, quantity):
+        """Registers a reorder of `quantity` units of `material` on `day`"""
+        self.advance(day)
+        supplier = self.supplier_for(material)
+        batch = self._batches.get(supplier)
+        if batch is None:
+            batch = self._batches[supplier] = {
+                "supplier": supplier,
+                "first_day": day,
+                "last_day": day,
+                "triggers": 0,
+                "materials": {}
+            }
+        batch["materials"][material] = batch["materials"].get(material, 0) + quantity
+        batch["last_day"] = day
+        batch["triggers"] += 1
+
+    def advance(self, day):
+        """Closes every batch whose window ended before `day`"""
+        for supplier, batch in list(self._batches.items()):
+            if day >= batch["first_day"] + self.window:
+                self._emit(self._batches.pop(supplier))
+
+    def flush(self):
+        """Closes all open batches, regardless of their window"""
+        for supplier in list(self._batches):
+            self._emit(self._batches.pop(supplier))
+
+    def _emit(self, batch):
+        materials = batch["materials"]
+        order = {
+            **batch,
+            "name": f"{batch['supplier']}_dia{batch['first_day']}",
+            "total_cost": sum(amount * MATERIAL_PRICES.get(material, 0) for material, amount in materials.items())
+        }
+        self.orders.append(order)
+        if self.generate_pdfs:
+            self._futures.append(self._executor.submit(self._generate, order))
+
+    def _generate(self, order):
+        # Import tardio: fpdf/PyPDF2 só são necessários quando se geram notas
+        from supply_processing import generate_supplier_order_pdfs
+        note = {
+            "name": order["name"],
+            "materials": {PDF_MATERIAL_NAMES.get(m, m): amount for m, amount in order["materials"].items()},
+            "total_cost": order["total_cost"]
+        }
+        return generate_supplier_order_pdfs([note], output_dir=self.output_dir, workers=1)[0]
+
+    def close(self):
+        """
+        Flushes open batches and waits for pending notes. Returns one result
+        per supplier order (PDF bytes or file path), in emission order.
+        """
+        self.flush()
+        results = [future.result() for future in self._futures]
+        self._futures = []
+        if self._own_executor:
+            self._executor.shutdown()
+        return results
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
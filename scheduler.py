@@ -0,0 +1,476 @@
+import bisect
+import heapq
+import threading
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+MINUTES_PER_DAY = 8 * 60  # one shift per line
+DEFAULT_LINES = 2
+
+# Estado de um trabalho no plano
+PLANNED = "planeada"
+LATE = "atrasada"
+BLOCKED = "sem_material"
+
+# Tolerância nas comparações de material (arredondamentos das receitas)
+_EPSILON = 1e-9
+
+
+class _Job:
+    __slots__ = ("order_id", "key", "deadline", "duration", "requirements",
+                 "after", "line", "start", "end", "status", "material_bound", "slack")
+
+    def __init__(self, order_id, key, deadline, duration, requirements):
+        self.order_id = order_id
+        self.key = key
+        self.deadline = deadline
+        self.duration = duration
+        self.requirements = requirements
+        self.after = None
+        self.line = None
+        self.start = None
+        self.end = None
+        self.status = None
+        self.material_bound = False
+        self.slack = None
+
+
+class ProductionScheduler:
+    """
+    Earliest-deadline-first production plan over `lines` identical lines.
+
+    Orders are sequenced by deadline (then by descending priority, then by
+    arrival). Each one starts on the line that frees up first, as soon as
+    the stock on hand plus the expected deliveries cover the materials it
+    uses, including what every order ahead of it reserved (even orders that
+    start later); materials are consumed when an order starts. Orders whose
+    materials never become available are left out of the plan (BLOCKED) and
+    consume nothing.
+
+    Time is in working minutes from the start of the plan: day `d` covers
+    minutes [d * minutes_per_day, (d + 1) * minutes_per_day), deliveries for
+    day `d` are usable from its first minute and a deadline is a minute.
+
+    The plan is kept between changes. After placing each order the
+    scheduler stores the state it leaves (line free times and cumulative
+    consumption), so a change only replans from the first order it can
+    affect: a new order from its position in the sequence, more material
+    from the first order that waited for material, less material from the
+    first order whose margin no longer covers it.
+    Changes are applied lazily, on the next plan().
+    """
+
+    def __init__(self, materials, stock=None, lines=DEFAULT_LINES, minutes_per_day=MINUTES_PER_DAY,
+                 deliveries=()):
+        if lines <= 0:
+            raise ValueError("lines must be positive")
+        if minutes_per_day <= 0:
+            raise ValueError("minutes_per_day must be positive")
+        self.materials = list(materials)
+        self._material_index = {material: m for m, material in enumerate(self.materials)}
+        self.lines = lines
+        self.minutes_per_day = minutes_per_day
+        self._stock = self._vector(stock or {})
+        self._deliveries = {}
+        for day, material, quantity in deliveries:
+            self._add_delivery(day, material, quantity)
+        self._rebuild_deliveries()
+
+        self._jobs = []
+        self._keys = []
+        self._by_id = {}
+        self._arrivals = 0
+        self._dirty = 0
+        self._lock = threading.RLock()
+        self.replanned = 0
+
+    def _vector(self, quantities):
+        vector = np.zeros(len(self.materials))
+        for material, quantity in quantities.items():
+            m = self._material_index.get(material)
+            if m is not None:
+                vector[m] = quantity
+        return vector
+
+    # Entregas previstas: disponível(dia) = estoque + _cumulative[linha de `dia`]
+
+    def _add_delivery(self, day, material, quantity):
+        m = self._material_index.get(material)
+        if m is None or not quantity:
+            return
+        vector = self._deliveries.get(day)
+        if vector is None:
+            vector = np.zeros(len(self.materials))
+        # O planeamento assume que a disponibilidade nunca desce com o tempo
+        if vector[m] + quantity < -_EPSILON:
+            raise ValueError(f"Delivery of {material} on day {day} would become negative")
+        vector[m] += quantity
+        self._deliveries[day] = vector
+
+    def _rebuild_deliveries(self):
+        days = sorted(self._deliveries)
+        self._delivery_days = days
+        cumulative = np.zeros((len(days) + 1, len(self.materials)))
+        for row, day in enumerate(days, start=1):
+            cumulative[row] = cumulative[row - 1] + self._deliveries[day]
+        self._cumulative = cumulative
+
+    def _available(self, day):
+        return self._stock + self._cumulative[bisect.bisect_right(self._delivery_days, day)]
+
+    def _ready_day(self, needed, used):
+        """First day on which stock plus deliveries cover `needed` for the `used` materials, or None"""
+        if np.all(self._stock[used] + self._cumulative[0][used] >= needed[used] - _EPSILON):
+            return 0
+        row = 0
+        for m in np.flatnonzero(used):
+            column = self._stock[m] + self._cumulative[:, m]
+            position = int(np.searchsorted(column, needed[m] - _EPSILON))
+            if position == len(column):
+                return None
+            row = max(row, position)
+        return max(self._delivery_days[row - 1], 0) if row else 0
+
+    # Alterações
+
+    def _mark(self, position):
+        if position < self._dirty:
+            self._dirty = position
+
+    def add_order(self, order_id, deadline, duration, requirements, priority=0):
+        """
+        Adds (or replaces) an order: `deadline` and `duration` in minutes,
+        `requirements` as {material: quantity} for the whole order.
+        """
+        with self._lock:
+            if order_id in self._by_id:
+                self.remove_order(order_id)
+            self._arrivals += 1
+            key = (deadline, -priority, self._arrivals)
+            job = _Job(order_id, key, deadline, duration, self._vector(requirements))
+            position = bisect.bisect_left(self._keys, key)
+            self._keys.insert(position, key)
+            self._jobs.insert(position, job)
+            self._by_id[order_id] = job
+            self._mark(position)
+
+    def remove_order(self, order_id):
+        """Removes an order (produced, cancelled...); unknown ids are ignored"""
+        with self._lock:
+            job = self._by_id.pop(order_id, None)
+            if job is None:
+                return False
+            position = bisect.bisect_left(self._keys, job.key)
+            del self._keys[position]
+            del self._jobs[position]
+            self._mark(position)
+            return True
+
+    def __contains__(self, order_id):
+        return order_id in self._by_id
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def _mark_more_material(self):
+        # Só avançam os trabalhos que esperavam por material (ou não tinham nenhum)
+        for position in range(self._dirty):
+            job = self._jobs[position]
+            if job.material_bound or job.status == BLOCKED:
+                self._mark(position)
+                return
+
+    def _mark_less_material(self, deltas):
+        # O prefixo mantém-se enquanto a margem de cada trabalho cobrir a redução
+        for position in range(self._dirty):
+            job = self._jobs[position]
+            if job.status != BLOCKED and np.any(job.slack + deltas < -_EPSILON):
+                self._mark(position)
+                return
+
+    def _apply_stock_change(self, deltas):
+        if np.any(deltas > 0):
+            self._mark_more_material()
+        if np.any(deltas < 0):
+            self._mark_less_material(np.minimum(deltas, 0))
+        # O estoque muda igual em todos os dias: a margem dos trabalhos mantidos muda com ele,
+        # senão várias reduções pequenas somadas deixariam o plano sobre-comprometido
+        for job in self._jobs[:self._dirty]:
+            if job.status != BLOCKED:
+                job.slack = job.slack + deltas
+
+    def adjust_stock(self, deltas):
+        """Applies stock changes as {material: delta}"""
+        with self._lock:
+            vector = self._vector(deltas)
+            self._stock = self._stock + vector
+            self._apply_stock_change(vector)
+
+    def set_stock(self, stock):
+        """Sets the on-hand quantity of the given materials"""
+        with self._lock:
+            vector = self._stock.copy()
+            for material, quantity in stock.items():
+                m = self._material_index.get(material)
+                if m is not None:
+                    vector[m] = quantity
+            deltas = vector - self._stock
+            self._stock = vector
+            self._apply_stock_change(deltas)
+
+    def add_delivery(self, day, material, quantity):
+        """
+        Registers an expected delivery of `quantity` units of `material` on
+        `day`; a negative quantity cancels (part of) an earlier delivery.
+        """
+        with self._lock:
+            self._add_delivery(day, material, quantity)
+            self._rebuild_deliveries()
+            if quantity > 0:
+                self._mark_more_material()
+            else:
+                self._mark(0)
+
+    def set_deliveries(self, deliveries):
+        """Replaces all expected deliveries with (day, material, quantity) tuples"""
+        with self._lock:
+            self._deliveries = {}
+            for day, material, quantity in deliveries:
+                self._add_delivery(day, material, quantity)
+            self._rebuild_deliveries()
+            self._mark(0)
+
+    # Planeamento
+
+    def _place(self, job, free, consumed):
+        needed = consumed + job.requirements
+        used = job.requirements > 0
+        ready_day = self._ready_day(needed, used)
+        if ready_day is None:
+            job.status = BLOCKED
+            job.line = job.start = job.end = None
+            job.material_bound = False
+            return consumed
+
+        line_free, line = heapq.heappop(free)
+        ready = ready_day * self.minutes_per_day
+        job.material_bound = ready > line_free
+        job.start = max(line_free, ready)
+        job.end = job.start + job.duration
+        job.line = line
+        job.status = LATE if job.end > job.deadline else PLANNED
+        # Margem de cada material usado no dia de início (sem limite para os outros)
+        job.slack = np.where(used, self._available(job.start // self.minutes_per_day) - needed, np.inf)
+        heapq.heappush(free, (job.end, line))
+        return needed
+
+    def _replan(self):
+        start = self._dirty
+        if start >= len(self._jobs):
+            self._dirty = len(self._jobs)
+            return
+        if start == 0:
+            free = [(0, line) for line in range(self.lines)]
+            consumed = np.zeros(len(self.materials))
+        else:
+            free, consumed = self._jobs[start - 1].after
+            free = list(free)
+
+        for job in self._jobs[start:]:
+            consumed = self._place(job, free, consumed)
+            job.after = (tuple(free), consumed)
+        self.replanned += len(self._jobs) - start
+        self._dirty = len(self._jobs)
+
+    def plan(self):
+        """
+        Returns the plan, one dict per order in sequence order, with line,
+        start, end, deadline, lateness (minutes) and status.
+        """
+        with self._lock:
+            self._replan()
+            return [
+                {
+                    "id_encomenda": job.order_id,
+                    "linha": job.line,
+                    "inicio": job.start,
+                    "fim": job.end,
+                    "prazo": job.deadline,
+                    "atraso": max(job.end - job.deadline, 0) if job.end is not None else None,
+                    "espera_material": job.material_bound,
+                    "status": job.status
+                }
+                for job in self._jobs
+            ]
+
+    def summary(self, plan=None):
+        """Totals of a plan: orders per status, makespan and per-line utilisation"""
+        plan = self.plan() if plan is None else plan
+        status = {PLANNED: 0, LATE: 0, BLOCKED: 0}
+        busy = [0] * self.lines
+        makespan = 0
+        for entry in plan:
+            status[entry["status"]] += 1
+            if entry["linha"] is not None:
+                busy[entry["linha"]] += entry["fim"] - entry["inicio"]
+                makespan = max(makespan, entry["fim"])
+        return {
+            "encomendas": len(plan),
+            "por_status": status,
+            "makespan": makespan,
+            "dias": -(-makespan // self.minutes_per_day),
+            "utilizacao_linhas": [b / makespan if makespan else 0.0 for b in busy]
+        }
+
+
+def parse_day(value, start_date):
+    """Day offset of a date (ISO string, date or datetime) from `start_date`"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if isinstance(value, datetime):
+        value = value.date()
+    if not isinstance(value, date):
+        raise ValueError(f"Invalid date: {value!r}")
+    return (value - start_date).days
+
+
+def job_from_encomenda(encomenda, tipos_roupa, bom, start_date, minutes_per_day=MINUTES_PER_DAY):
+    """
+    Converts an encomenda into scheduler arguments (deadline, duration,
+    requirements): the deadline is the end of the prazo_entrega day, the
+    duration is the sum of tempo_producao (minutes per unit) x quantity over
+    the items and requirements come from the BOM.
+
+    Raises ValueError for an invalid prazo_entrega, unknown type or size.
+    """
+    deadline = (parse_day(encomenda.get("prazo_entrega"), start_date) + 1) * minutes_per_day
+    itens = encomenda.get("itens") or []
+    duration = 0
+    for item in itens:
+        tipo = tipos_roupa.get(item.get("id_tipo"))
+        if tipo is None:
+            raise ValueError(f"Tipo de roupa não encontrado: {item.get('id_tipo')}")
+        if item.get("tamanho") not in bom.sizes:
+            raise ValueError(f"Tamanho inválido: {item.get('tamanho')}")
+        duration += tipo.get("tempo_producao", 0) * item.get("quantidade", 1)
+
+    requirements = {}
+    if itens:
+        totals = bom.totals(
+            [item["id_tipo"] for item in itens],
+            [item["tamanho"] for item in itens],
+            [item.get("quantidade", 1) for item in itens]
+        )
+        requirements = dict(zip(bom.materials, totals.tolist()))
+    return deadline, duration, requirements
+
+
+class OpenOrderPlanner:
+    """
+    Keeps a ProductionScheduler in sync with the database: built from the
+    open encomendas, stock and expected deliveries, then updated from the
+    DatabaseHandler stock and encomenda events (register on_stock_event and
+    on_event as listeners) instead of being rebuilt.
+
+    Encomendas that cannot be planned (unknown type or size, bad
+    prazo_entrega) are kept in `invalid` with the reason. `stale` is set
+    when an event cannot be applied incrementally; the owner should then
+    build a new planner.
+    """
+
+    def __init__(self, tipos_roupa, stock, deliveries, encomendas, start_date=None, lines=DEFAULT_LINES,
+                 minutes_per_day=MINUTES_PER_DAY, open_status=("pendente",)):
+        from bom import BOMTensor
+        tipos_roupa = list(tipos_roupa)
+        self.tipos_roupa = {tipo["id_tipo"]: tipo for tipo in tipos_roupa}
+        self.bom = BOMTensor.from_tipos_roupa(tipos_roupa)
+        self.start_date = start_date or date.today()
+        self.open_status = set(open_status)
+        self.invalid = {}
+        self.stale = False
+        self._deliveries = {}
+        # Os eventos chegam nas threads das escritas
+        self._lock = threading.RLock()
+        self.scheduler = ProductionScheduler(self.bom.materials, stock, lines, minutes_per_day)
+        for delivery in deliveries:
+            self._set_delivery(delivery)
+        for encomenda in encomendas:
+            self._set_encomenda(encomenda)
+
+    @property
+    def lines(self):
+        return self.scheduler.lines
+
+    @property
+    def minutes_per_day(self):
+        return self.scheduler.minutes_per_day
+
+    def _set_encomenda(self, encomenda):
+        order_id = encomenda["id_encomenda"]
+        self.invalid.pop(order_id, None)
+        if encomenda.get("status") not in self.open_status:
+            self.scheduler.remove_order(order_id)
+            return
+        try:
+            deadline, duration, requirements = job_from_encomenda(
+                encomenda, self.tipos_roupa, self.bom, self.start_date, self.minutes_per_day
+            )
+        except (ValueError, TypeError, KeyError) as e:
+            self.scheduler.remove_order(order_id)
+            self.invalid[order_id] = str(e)
+            return
+        self.scheduler.add_order(order_id, deadline, duration, requirements, encomenda.get("prioridade", 0))
+
+    def _set_delivery(self, delivery):
+        previous = self._deliveries.pop(delivery["id_entrega"], None)
+        if previous is not None:
+            day, material, quantity = previous
+            self.scheduler.add_delivery(day, material, -quantity)
+        if not delivery.get("recebida"):
+            day = parse_day(delivery["data_prevista"], self.start_date)
+            self._deliveries[delivery["id_entrega"]] = (day, delivery["id_material"], delivery["quantidade"])
+            self.scheduler.add_delivery(day, delivery["id_material"], delivery["quantidade"])
+
+    def on_stock_event(self, event):
+        """DatabaseHandler stock listener"""
+        if event.get("tipo") != "estoque":
+            return
+        with self._lock:
+            if event.get("delta") is not None:
+                self.scheduler.adjust_stock({event["id_material"]: event["delta"]})
+            elif event.get("quantidade") is not None:
+                self.scheduler.set_stock({event["id_material"]: event["quantidade"]})
+            else:
+                self.stale = True
+
+    def on_event(self, event):
+        """DatabaseHandler encomenda / expected delivery listener"""
+        with self._lock:
+            try:
+                if event.get("tipo") == "encomenda":
+                    self._set_encomenda(event["encomenda"])
+                elif event.get("tipo") == "entrega":
+                    self._set_delivery(event["entrega"])
+            except (ValueError, TypeError, KeyError):
+                self.stale = True
+
+    def plan(self):
+        """Plan with calendar dates, summary and the encomendas left out"""
+        with self._lock:
+            plan = self.scheduler.plan()
+            invalid = dict(self.invalid)
+        minutes_per_day = self.minutes_per_day
+        for entry in plan:
+            if entry["inicio"] is not None:
+                last_minute = max(entry["fim"] - 1, entry["inicio"])
+                entry["data_inicio"] = (self.start_date + timedelta(days=entry["inicio"] // minutes_per_day)).isoformat()
+                entry["data_fim"] = (self.start_date + timedelta(days=last_minute // minutes_per_day)).isoformat()
+        return {
+            "inicio": self.start_date.isoformat(),
+            "linhas": self.lines,
+            "minutos_por_dia": minutes_per_day,
+            "resumo": self.scheduler.summary(plan),
+            "plano": plan,
+            "invalidas": invalid
+        }
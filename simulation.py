@@ -0,0 +1,313 @@
+import heapq
+import math
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from data_processing import (
+    HOLDING_COST,
+    LEAD_TIME,
+    ORDER_COST,
+    calculate_economic_order_quantity,
+    calculate_reorder_point
+)
+
+class ReorderPolicy:
+    """
+    Base class for reorder policies.
+
+    `order_quantity` receives the SKU's inventory position (on hand + on order
+    - backorders) and returns how much to order now (0 for nothing).
+    Continuous-review policies are asked after every demand event; policies
+    with a `review_period` are only asked at their review events.
+
+    `order_quantities` is the same decision for an array of positions (used
+    by montecarlo to step many replications at once).
+    """
+
+    review_period = None
+
+    def order_quantity(self, sku, inventory_position, day):
+        raise NotImplementedError
+
+    def order_quantities(self, inventory_positions, day):
+        return np.array([self.order_quantity(None, position, day) for position in inventory_positions],
+                        dtype=np.float64)
+
+
+class SQPolicy(ReorderPolicy):
+    """(s, Q): when the position drops to s or below, order multiples of Q until it is above s"""
+
+    def __init__(self, reorder_point, order_quantity):
+        if order_quantity <= 0:
+            raise ValueError("order_quantity must be positive")
+        self.reorder_point = reorder_point
+        self.quantity = order_quantity
+
+    def order_quantity(self, sku, inventory_position, day):
+        if inventory_position > self.reorder_point:
+            return 0
+        batches = math.floor((self.reorder_point - inventory_position) / self.quantity) + 1
+        return batches * self.quantity
+
+    def order_quantities(self, inventory_positions, day):
+        batches = np.floor((self.reorder_point - inventory_positions) / self.quantity) + 1
+        return np.where(inventory_positions > self.reorder_point, 0.0, batches * self.quantity)
+
+
+class SSPolicy(ReorderPolicy):
+    """(s, S): when the position drops to s or below, order up to S"""
+
+    def __init__(self, reorder_point, order_up_to):
+        self.reorder_point = reorder_point
+        self.order_up_to = order_up_to
+
+    def order_quantity(self, sku, inventory_position, day):
+        if inventory_position > self.reorder_point:
+            return 0
+        return self.order_up_to - inventory_position
+
+    def order_quantities(self, inventory_positions, day):
+        return np.where(inventory_positions > self.reorder_point, 0.0, self.order_up_to - inventory_positions)
+
+
+class PeriodicReviewPolicy(ReorderPolicy):
+    """(R, S) or (R, s, S): every R days order up to S (only if the position is at or below s, when given)"""
+
+    def __init__(self, review_period, order_up_to, reorder_point=None, first_review=0):
+        if review_period <= 0:
+            raise ValueError("review_period must be positive")
+        self.review_period = review_period
+        self.order_up_to = order_up_to
+        self.reorder_point = reorder_point
+        self.first_review = first_review
+
+    def order_quantity(self, sku, inventory_position, day):
+        if self.reorder_point is not None and inventory_position > self.reorder_point:
+            return 0
+        return max(self.order_up_to - inventory_position, 0)
+
+    def order_quantities(self, inventory_positions, day):
+        quantities = np.maximum(self.order_up_to - inventory_positions, 0.0)
+        if self.reorder_point is None:
+            return quantities
+        return np.where(inventory_positions > self.reorder_point, 0.0, quantities)
+
+
+def policy_from_constants():
+    """The (s, Q) policy used by data_processing: ROP from constants and the global EOQ"""
+    return SQPolicy(calculate_reorder_point(), calculate_economic_order_quantity())
+
+
+@dataclass
+class SkuResult:
+    sku: str
+    initial_stock: float
+    final_stock: float = 0.0
+    demand: float = 0.0
+    fulfilled: float = 0.0
+    unmet: float = 0.0
+    stockout_events: int = 0
+    orders_placed: int = 0
+    units_ordered: float = 0.0
+    units_received: float = 0.0
+    holding_cost: float = 0.0
+    order_cost: float = 0.0
+
+    @property
+    def fill_rate(self):
+        return self.fulfilled / self.demand if self.demand else 1.0
+
+    @property
+    def total_cost(self):
+        return self.holding_cost + self.order_cost
+
+
+@dataclass
+class SimulationResult:
+    horizon: int
+    skus: dict
+    events_processed: int
+    trace: list = field(default_factory=list)
+
+    @property
+    def total_cost(self):
+        return sum(result.total_cost for result in self.skus.values())
+
+    def as_dict(self):
+        """Plain-dict summary, one entry per SKU"""
+        return {
+            sku: {
+                "final_stock": r.final_stock,
+                "demand": r.demand,
+                "fulfilled": r.fulfilled,
+                "unmet": r.unmet,
+                "fill_rate": r.fill_rate,
+                "stockout_events": r.stockout_events,
+                "orders_placed": r.orders_placed,
+                "units_ordered": r.units_ordered,
+                "holding_cost": r.holding_cost,
+                "order_cost": r.order_cost,
+                "total_cost": r.total_cost
+            }
+            for sku, r in self.skus.items()
+        }
+
+
+class StockSimulator:
+    """
+    Discrete-event stock simulation over many SKUs.
+
+    SKUs do not interact, so each one is simulated on its own event stream:
+    demand events (already in day order) are merged with a heap of pending
+    deliveries and the SKU's review events, and only days on which something
+    happens are visited. Nothing is printed; pass `record_trace=True` to get
+    the processed events back in the result.
+
+    Within a day, deliveries arrive first, then demand is served and
+    continuous-review policies are checked; periodic reviews happen at the
+    end of the day.
+
+    `lead_time` is a number of days or a callable (sku, day) -> days.
+    Holding cost is charged per unit per year (as in the EOQ formula) on the
+    on-hand stock at the end of each day.
+    """
+
+    def __init__(self, initial_stock, policies, lead_time=LEAD_TIME, order_cost=ORDER_COST,
+                 holding_cost=HOLDING_COST, backorders=False, record_trace=False):
+        self.initial_stock = dict(initial_stock)
+        if isinstance(policies, ReorderPolicy):
+            policies = {sku: policies for sku in self.initial_stock}
+        self.policies = policies
+        self.lead_time = lead_time
+        self.order_cost = order_cost
+        self.holding_cost = holding_cost
+        self.backorders = backorders
+        self.record_trace = record_trace
+        self._demand = {sku: [] for sku in self.initial_stock}
+        self._deliveries = {sku: [] for sku in self.initial_stock}
+
+    def add_demand(self, day, sku, quantity):
+        """Schedules a single demand event"""
+        if quantity:
+            self._demand[sku].append((day, float(quantity)))
+
+    def add_demand_series(self, sku, daily_quantities, start_day=0):
+        """Schedules one demand event per non-zero day of a daily series"""
+        self._demand[sku].extend(
+            (start_day + offset, float(quantity))
+            for offset, quantity in enumerate(daily_quantities)
+            if quantity
+        )
+
+    def add_delivery(self, day, sku, quantity):
+        """Schedules a delivery already on order before the simulation starts"""
+        self._deliveries[sku].append((day, float(quantity)))
+
+    def run(self, horizon):
+        """Runs days 0..horizon-1 and returns a SimulationResult"""
+        results = {}
+        trace = [] if self.record_trace else None
+        processed = 0
+        for sku, stock in self.initial_stock.items():
+            result, events = self._run_sku(sku, stock, horizon, trace)
+            results[sku] = result
+            processed += events
+        return SimulationResult(horizon, results, processed, trace or [])
+
+    def _run_sku(self, sku, stock, horizon, trace):
+        policy = self.policies.get(sku)
+        review_period = policy.review_period if policy is not None else None
+        continuous = policy is not None and not review_period
+        lead_time = self.lead_time
+        daily_holding = self.holding_cost / 365.0
+        backorders = self.backorders
+
+        demand = self._demand[sku]
+        demand.sort(key=lambda event: event[0])
+        deliveries = list(self._deliveries[sku])
+        heapq.heapify(deliveries)
+
+        result = SkuResult(sku, stock)
+        on_hand = float(stock)
+        on_order = sum(quantity for _, quantity in deliveries)
+        last_day = 0
+        holding = 0.0
+        events = 0
+        next_review = getattr(policy, "first_review", 0) if review_period else horizon
+
+        def advance(day):
+            # Custo de posse do estoque entre o último evento e este dia
+            nonlocal holding, last_day
+            if day > last_day:
+                if on_hand > 0:
+                    holding += on_hand * (day - last_day) * daily_holding
+                last_day = day
+
+        def order(day):
+            nonlocal on_order
+            quantity = policy.order_quantity(sku, on_hand + on_order, day)
+            if quantity <= 0:
+                return
+            on_order += quantity
+            result.orders_placed += 1
+            result.units_ordered += quantity
+            arrival = day + (lead_time(sku, day) if callable(lead_time) else lead_time)
+            heapq.heappush(deliveries, (arrival, quantity))
+            if trace is not None:
+                trace.append((day, "order", sku, quantity, arrival))
+
+        def receive_until(day):
+            nonlocal on_hand, on_order, events
+            while deliveries and deliveries[0][0] <= day:
+                arrival, quantity = heapq.heappop(deliveries)
+                advance(arrival)
+                on_hand += quantity
+                on_order = max(on_order - quantity, 0.0)
+                result.units_received += quantity
+                events += 1
+                if trace is not None:
+                    trace.append((arrival, "delivery", sku, quantity, on_hand))
+
+        def review_until(day):
+            # Revisões periódicas de dias anteriores a `day` (fim de dia)
+            nonlocal next_review, events
+            while next_review < day:
+                receive_until(next_review)
+                advance(next_review)
+                order(next_review)
+                events += 1
+                next_review += review_period
+
+        for day, quantity in demand:
+            if day >= horizon:
+                break
+            if day >= next_review:
+                review_until(day)
+            if deliveries and deliveries[0][0] <= day:
+                receive_until(day)
+            advance(day)
+
+            available = on_hand if on_hand > 0 else 0.0
+            fulfilled = quantity if quantity < available else available
+            result.demand += quantity
+            result.fulfilled += fulfilled
+            if fulfilled < quantity:
+                result.stockout_events += 1
+                result.unmet += quantity - fulfilled
+            # Sem backorders a procura não satisfeita perde-se
+            on_hand -= quantity if backorders else fulfilled
+            events += 1
+            if trace is not None:
+                trace.append((day, "demand", sku, quantity, on_hand))
+            if continuous:
+                order(day)
+
+        review_until(horizon)
+        receive_until(horizon - 1)
+        advance(horizon)
+
+        result.final_stock = on_hand
+        result.holding_cost = holding
+        result.order_cost = result.orders_placed * self.order_cost
+        return result, events
@@ -1,7 +1,9 @@
 from fpdf import FPDF
-from datetime import datetime
-import pandas as pd 
+from concurrent.futures import ProcessPoolExecutor
+import functools
 import os
+import re
+import uuid
 from PyPDF2 import PdfReader, PdfWriter
 import io
 
@@ -21,80 +23,170 @@ AGGREGATED_MATERIALS = {
 }
 TOTAL_COST = 500
 
-def generate_supplier_order_pdf(aggregated_materials, total_cost):
+TEMPLATE_PATH = "Nota de encomenda.pdf"
+OUTPUT_PATH = "Nota_de_Encomenda_SciTeCh24.pdf"
+
+def _render_table(aggregated_materials, total_cost):
+    """Renderiza a tabela da nota de encomenda num PDF em memória"""
+    # Cria um PDF temporário com apenas a tabela
+    temp_pdf = FPDF()
+    temp_pdf.add_page()
+    
+    # Define posição inicial da tabela
+    start_x = 24
+    start_y = 120
+    temp_pdf.set_xy(start_x, start_y)
+    
+    # Larguras das colunas
+    col_widths = {
+        'artigo': 35,
+        'quantidade': 45,
+        'preco': 36,
+        'subtotal': 45
+    }
+    
+    # Cabeçalho da tabela
+    temp_pdf.set_font("Helvetica", "B", 10)
+    temp_pdf.set_text_color(0, 0, 0)  # Cor do texto preta
+    
+    # Dados da tabela
+    temp_pdf.set_font("Helvetica", "", 10)
+    for material, amount in aggregated_materials.items():
+        temp_pdf.set_x(start_x)  # Garante que cada linha comece no mesmo x
+        unit_price = MATERIAL_PRICES.get(material, 0)
+        subtotal = amount * unit_price
+        temp_pdf.cell(col_widths['artigo'], 10, material.capitalize(), border=1)
+        temp_pdf.cell(col_widths['preco'], 10, f"EUR {unit_price:.2f}", border=1, align='C')
+        temp_pdf.cell(col_widths['quantidade'], 10, f"{amount:.0f}", border=1, align='C')
+        temp_pdf.cell(col_widths['subtotal'], 10, f"EUR {subtotal:.2f}", border=1, align='C')
+        temp_pdf.ln(10)
+    
+    # Total
+    temp_pdf.set_x(start_x)
+    temp_pdf.set_font("Helvetica", "B", 10)
+    total_width = col_widths['artigo'] + col_widths['quantidade'] + col_widths['preco']
+    temp_pdf.cell(total_width, 10, "Total:", border=1)
+    temp_pdf.cell(col_widths['subtotal'], 10, f"EUR {total_cost:.2f}", border=1, align='C')
+    
+    # Salva o PDF temporário em memória
+    pdf_bytes = io.BytesIO()
+    temp_pdf.output(pdf_bytes)
+    pdf_bytes.seek(0)
+    return pdf_bytes
+
+
+@functools.lru_cache(maxsize=None)
+def _load_template(template_path=TEMPLATE_PATH):
+    """Lê e analisa o PDF template uma única vez por processo"""
+    return PdfReader(template_path)
+
+
+def calculate_total_cost(aggregated_materials):
+    """Custo total de uma encomenda a partir de MATERIAL_PRICES"""
+    return sum(amount * MATERIAL_PRICES.get(material, 0) for material, amount in aggregated_materials.items())
+
+
+def render_supplier_order_pdf(aggregated_materials, total_cost=None, template_path=TEMPLATE_PATH):
+    """
+    Gera a nota de encomenda e devolve-a em bytes, sem escrever em disco.
+    O template é lido apenas na primeira chamada de cada processo.
+    """
+    if total_cost is None:
+        total_cost = calculate_total_cost(aggregated_materials)
+
+    overlay = PdfReader(_render_table(aggregated_materials, total_cost))
+    writer = PdfWriter()
+
+    # add_page copia a página para o writer, pelo que o template em cache não é alterado
+    page = writer.add_page(_load_template(template_path).pages[0])
+    page.merge_page(overlay.pages[0])
+
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+def generate_supplier_order_pdf(aggregated_materials, total_cost, output_path=OUTPUT_PATH):
     try:
-        # Cria um PDF temporário com apenas a tabela
-        temp_pdf = FPDF()
-        temp_pdf.add_page()
-        
-        # Define posição inicial da tabela
-        start_x = 24
-        start_y = 120
-        temp_pdf.set_xy(start_x, start_y)
-        
-        # Larguras das colunas
-        col_widths = {
-            'artigo': 35,
-            'quantidade': 45,
-            'preco': 36,
-            'subtotal': 45
-        }
-        
-        # Cabeçalho da tabela
-        temp_pdf.set_font("Helvetica", "B", 10)
-        temp_pdf.set_text_color(0, 0, 0)  # Cor do texto preta
-        
-        # Dados da tabela
-        temp_pdf.set_font("Helvetica", "", 10)
-        for material, amount in aggregated_materials.items():
-            temp_pdf.set_x(start_x)  # Garante que cada linha comece no mesmo x
-            unit_price = MATERIAL_PRICES.get(material, 0)
-            subtotal = amount * unit_price
-            temp_pdf.cell(col_widths['artigo'], 10, material.capitalize(), border=1)
-            temp_pdf.cell(col_widths['preco'], 10, f"EUR {unit_price:.2f}", border=1, align='C')
-            temp_pdf.cell(col_widths['quantidade'], 10, f"{amount:.0f}", border=1, align='C')
-            temp_pdf.cell(col_widths['subtotal'], 10, f"EUR {subtotal:.2f}", border=1, align='C')
-            temp_pdf.ln(10)
-        
-        # Total
-        temp_pdf.set_x(start_x)
-        temp_pdf.set_font("Helvetica", "B", 10)
-        total_width = col_widths['artigo'] + col_widths['quantidade'] + col_widths['preco']
-        temp_pdf.cell(total_width, 10, "Total:", border=1)
-        temp_pdf.cell(col_widths['subtotal'], 10, f"EUR {total_cost:.2f}", border=1, align='C')
-        
-        # Salva o PDF temporário em memória
-        pdf_bytes = io.BytesIO()
-        temp_pdf.output(pdf_bytes)
-        pdf_bytes.seek(0)
-        
-        # Abre o PDF template
-        reader = PdfReader("Nota de encomenda.pdf")
-        writer = PdfWriter()
-        
-        # Pega a primeira página do template
-        page = reader.pages[0]
-        
-        # Adiciona a tabela por cima
-        overlay = PdfReader(pdf_bytes)
-        page.merge_page(overlay.pages[0])
-        
-        # Adiciona a página modificada ao writer
-        writer.add_page(page)
-        
+        pdf = render_supplier_order_pdf(aggregated_materials, total_cost)
+
         # Salva o PDF final
-        with open("Nota_de_Encomenda_SciTeCh24.pdf", "wb") as output_file:
-            writer.write(output_file)
+        with open(output_path, "wb") as output_file:
+            output_file.write(pdf)
             
-        print("Nota de encomenda gerada com sucesso: Nota_de_Encomenda_SciTeCh24.pdf")
+        print(f"Nota de encomenda gerada com sucesso: {output_path}")
+        return output_path
             
     except Exception as e:
         print(f"Erro ao gerar PDF: {e}")
-        print("Certifique-se de que o arquivo 'Nota de encomenda.pdf' existe no diretório")
+        print(f"Certifique-se de que o arquivo '{TEMPLATE_PATH}' existe no diretório")
+
+
+def _unique_output_path(output_dir, name):
+    """Nome de ficheiro único por nota, para execuções concorrentes não se sobreporem"""
+    slug = re.sub(r'[^A-Za-z0-9_-]+', '_', str(name)).strip('_') or "nota"
+    return os.path.join(output_dir, f"Nota_de_Encomenda_{slug}_{uuid.uuid4().hex[:12]}.pdf")
+
+
+def _render_order(order, output_dir):
+    pdf = render_supplier_order_pdf(order["materials"], order.get("total_cost"))
+    if output_dir is None:
+        return pdf
+    path = _unique_output_path(output_dir, order.get("name", "nota"))
+    with open(path, "wb") as output_file:
+        output_file.write(pdf)
+    return path
+
+
+def generate_supplier_order_pdfs(orders, output_dir=None, workers=None):
+    """
+    Gera várias notas de encomenda (por fornecedor, dia ou evento de
+    reposição) num pool de processos.
+
+    Cada encomenda é um dict {"name": str, "materials": {material: qtd},
+    "total_cost": float opcional}. Devolve, pela mesma ordem, os PDFs em
+    bytes ou, se output_dir for indicado, os caminhos dos ficheiros criados.
+    """
+    orders = list(orders)
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+    render = functools.partial(_render_order, output_dir=output_dir)
+
+    if workers == 1 or len(orders) <= 1:
+        return [render(order) for order in orders]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(render, orders, chunksize=max(1, len(orders) // (4 * (workers or os.cpu_count())))))
 
 def main():
-    orders_df = pd.read_excel("./output.xlsx")
-    generate_supplier_order_pdf(AGGREGATED_MATERIALS, TOTAL_COST)
+    # O motor de estoque e o armazém de encomendas só são necessários aqui (a API gera PDFs sem eles)
+    from data_processing import INITIAL_STOCK, MATERIAL_PRICES as STOCK_MATERIALS
+    from data_processing import MaterialAccumulator, calculate_reorder_point, check_reorder_point
+    from order_store import OrderStore
+    from replenishment import ReplenishmentPipeline
+
+    # O output.xlsx só é lido na primeira execução, para popular o armazém
+    store = OrderStore()
+    if store.is_empty():
+        store.import_xlsx("./output.xlsx")
+    orders_df = store.orders(["Day", "Quantity", "Type", "Size"]).to_pandas()
+
+    # Repete a simulação de estoque sobre as encomendas; os pedidos de reposição
+    # são agrupados por fornecedor e cada grupo gera uma nota de encomenda
+    reorder_point = calculate_reorder_point()
+    stock = {material: INITIAL_STOCK for material in STOCK_MATERIALS}
+    pending_orders = {}
+    accumulator = MaterialAccumulator()
+    pipeline = ReplenishmentPipeline(output_dir=".")
+    for day, day_orders in orders_df.groupby("Day", sort=True):
+        orders = day_orders[["Quantity", "Type", "Size"]].to_dict("records")
+        for order in orders:
+            accumulator.add(order)
+        stock = check_reorder_point(orders, stock, int(day), reorder_point, pending_orders, accumulator,
+                                    verbose=False, replenishment=pipeline)
+
+    for order, path in zip(pipeline.orders, pipeline.close()):
+        print(f"Nota de encomenda gerada com sucesso: {path} "
+              f"({order['triggers']} pedidos de reposição, EUR {order['total_cost']:.2f})")
 
 if __name__ == "__main__":
     main()
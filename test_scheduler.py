@@ -0,0 +1,115 @@
+import random
+
+import pytest
+
+from scheduler import BLOCKED, ProductionScheduler
+
+MATERIALS = ["TECIDO001", "ALGODAO001", "FIO001", "POLIESTER001"]
+
+
+class RecordedScheduler:
+    """
+    A ProductionScheduler plus a record of the orders, stock and deliveries
+    given to it, so the same state can be planned from scratch.
+    """
+
+    def __init__(self, materials, stock, lines=1, minutes_per_day=480, deliveries=()):
+        self.args = (list(materials), lines, minutes_per_day)
+        self.scheduler = ProductionScheduler(materials, stock, lines, minutes_per_day, deliveries)
+        self.stock = dict(stock)
+        self.deliveries = {}
+        for day, material, quantity in deliveries:
+            self._record_delivery(day, material, quantity)
+        # Por ordem de chegada, que desempata os prazos iguais
+        self.orders = {}
+
+    def _record_delivery(self, day, material, quantity):
+        self.deliveries[day, material] = self.deliveries.get((day, material), 0.0) + quantity
+
+    def add_order(self, order_id, deadline, duration, requirements, priority=0):
+        self.scheduler.add_order(order_id, deadline, duration, requirements, priority)
+        self.orders.pop(order_id, None)
+        self.orders[order_id] = (deadline, duration, requirements, priority)
+
+    def remove_order(self, order_id):
+        self.scheduler.remove_order(order_id)
+        self.orders.pop(order_id, None)
+
+    def adjust_stock(self, deltas):
+        self.scheduler.adjust_stock(deltas)
+        for material, delta in deltas.items():
+            self.stock[material] = self.stock.get(material, 0.0) + delta
+
+    def set_stock(self, stock):
+        self.scheduler.set_stock(stock)
+        self.stock.update(stock)
+
+    def add_delivery(self, day, material, quantity):
+        self.scheduler.add_delivery(day, material, quantity)
+        self._record_delivery(day, material, quantity)
+
+    def plan(self):
+        return self.scheduler.plan()
+
+    def full_replan(self):
+        """Plan of a new scheduler given the same orders, stock and deliveries"""
+        materials, lines, minutes_per_day = self.args
+        reference = ProductionScheduler(
+            materials, self.stock, lines, minutes_per_day,
+            [(day, material, quantity) for (day, material), quantity in self.deliveries.items()]
+        )
+        for order_id, (deadline, duration, requirements, priority) in self.orders.items():
+            reference.add_order(order_id, deadline, duration, requirements, priority)
+        return reference.plan()
+
+
+def test_successive_reductions_within_slack():
+    scheduler = RecordedScheduler(["a"], {"a": 20})
+    scheduler.add_order("o", 480, 10, {"a": 10})
+    assert scheduler.plan()[0]["status"] != BLOCKED
+    scheduler.adjust_stock({"a": -6})
+    assert scheduler.plan()[0]["status"] != BLOCKED
+    scheduler.adjust_stock({"a": -6})
+    assert scheduler.plan()[0]["status"] == BLOCKED
+    assert scheduler.plan() == scheduler.full_replan()
+
+
+def test_delivery_cannot_become_negative():
+    scheduler = ProductionScheduler(["a"], {"a": 20}, deliveries=[(3, "a", 5)])
+    with pytest.raises(ValueError):
+        scheduler.add_delivery(3, "a", -6)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_incremental_matches_full_replan(seed):
+    rng = random.Random(seed)
+    scheduler = RecordedScheduler(
+        MATERIALS, {m: 3000 for m in MATERIALS}, lines=3, minutes_per_day=480,
+        deliveries=[(day, rng.choice(MATERIALS), rng.randint(100, 900)) for day in range(0, 120, 9)]
+    )
+    for i in range(300):
+        scheduler.add_order(f"e{i}", rng.randint(1, 150) * 480, rng.randint(30, 600),
+                            {m: rng.uniform(0, 40) for m in rng.sample(MATERIALS, 2)})
+    assert scheduler.plan() == scheduler.full_replan()
+
+    for step in range(300):
+        event = rng.random()
+        if event < 0.3:
+            scheduler.add_order(f"n{step}", rng.randint(1, 160) * 480, rng.randint(30, 600),
+                                {m: rng.uniform(0, 40) for m in rng.sample(MATERIALS, 2)})
+        elif event < 0.6:
+            # Reduções pequenas e repetidas, que cabem uma a uma na margem dos trabalhos
+            scheduler.adjust_stock({rng.choice(MATERIALS): rng.uniform(-200, 100)})
+        elif event < 0.7:
+            scheduler.set_stock({rng.choice(MATERIALS): rng.uniform(0, 3000)})
+        elif event < 0.85:
+            scheduler.remove_order(f"e{rng.randint(0, 299)}")
+        elif event < 0.95:
+            scheduler.add_delivery(rng.randint(0, 150), rng.choice(MATERIALS), rng.uniform(0, 900))
+        else:
+            # Cancela uma entrega já registada
+            pending = sorted(key for key, quantity in scheduler.deliveries.items() if quantity > 0)
+            if pending:
+                day, material = rng.choice(pending)
+                scheduler.add_delivery(day, material, -scheduler.deliveries[day, material])
+        assert scheduler.plan() == scheduler.full_replan(), step